@@ -0,0 +1,72 @@
+"""
+Модуль атомарной записи файлов: запись во временный файл рядом с целевым и замена целевого файла
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+# Размер буфера записи (байт)
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def current_umask():
+    """Текущая маска прав создаваемых файлов"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Маска определяется один раз при импорте: os.umask меняет состояние всего процесса
+UMASK = current_umask()
+
+
+def sync_directory(directory):
+    """Сброс на диск записи каталога (чтобы переименование пережило сбой питания)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    try:
+        handle = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(handle)
+    except OSError:
+        pass
+    finally:
+        os.close(handle)
+
+
+@contextmanager
+def atomic_open(filename, mode='w', encoding='utf-8', newline=''):
+    """Открытие файла для перезаписи без риска потерять старое содержимое
+
+    Данные пишутся во временный файл в том же каталоге, при успешном завершении блока with
+    он сбрасывается на диск и атомарно заменяет целевой файл. При ошибке целевой файл не меняется,
+    а другие окна продолжают читать старую версию файла, пока идет запись
+    """
+    if 'b' in mode:
+        encoding = newline = None
+
+    filename = os.path.abspath(filename)
+    directory = os.path.dirname(filename)
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+    try:
+        with os.fdopen(handle, mode, buffering=WRITE_BUFFER_SIZE, encoding=encoding, newline=newline) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+
+        # Временный файл создается с правами 0600 - переносим права старого файла или права по умолчанию
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp_path)
+        else:
+            os.chmod(temp_path, 0o666 & ~UMASK)
+
+        os.replace(temp_path, filename)
+        sync_directory(directory)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
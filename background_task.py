@@ -0,0 +1,166 @@
+"""
+Модуль для выполнения длительных операций в фоновом потоке с окном прогресса
+"""
+
+import tkinter as tk
+from tkinter import ttk
+import queue
+import threading
+import time
+
+
+class TaskCancelled(Exception):
+    """Исключение для прерывания задачи по кнопке "Отмена\""""
+
+
+class ProgressDialog:
+    """Окно прогресса с кнопкой отмены"""
+
+    def __init__(self, parent, title, on_cancel):
+        self.window = tk.Toplevel(parent)
+        self.window.title(title)
+        self.window.geometry("420x130")
+        self.window.resizable(False, False)
+        self.window.transient(parent)
+        self.window.protocol("WM_DELETE_WINDOW", on_cancel)
+
+        frame = ttk.Frame(self.window, padding="15")
+        frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.window.columnconfigure(0, weight=1)
+        frame.columnconfigure(0, weight=1)
+
+        self.text_var = tk.StringVar(value=title)
+        ttk.Label(frame, textvariable=self.text_var).grid(row=0, column=0, sticky=tk.W)
+
+        self.progress = ttk.Progressbar(frame, orient=tk.HORIZONTAL, mode='determinate', maximum=100)
+        self.progress.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=10)
+
+        ttk.Button(frame, text="Отмена", command=on_cancel).grid(row=2, column=0)
+
+    def update(self, done, total, text=None):
+        """Обновление индикатора прогресса"""
+        if total:
+            self.progress['value'] = min(100.0, done * 100.0 / total)
+        if text is not None:
+            self.text_var.set(text)
+
+    def close(self):
+        """Закрытие окна прогресса"""
+        if self.window.winfo_exists():
+            self.window.destroy()
+
+
+class BackgroundTask:
+    """Фоновая задача: рабочий поток передает сообщения в очередь, окно опрашивает ее через after()"""
+
+    # Интервал опроса очереди (мс) и время обработки сообщений за один опрос (с)
+    POLL_INTERVAL = 50
+    POLL_BUDGET = 0.04
+
+    def __init__(self, parent, title, work, on_done, on_error=None, on_chunk=None, on_cancel=None):
+        self.parent = parent
+        self.title = title
+        self.work = work
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_chunk = on_chunk
+        self.on_cancel = on_cancel
+
+        # Ограниченная очередь не дает рабочему потоку уйти далеко вперед
+        self.queue = queue.Queue(maxsize=64)
+        self.cancel_event = threading.Event()
+        # Итог работы потока: ('done', результат), ('error', исключение) или ('cancelled',)
+        self.outcome = None
+        self.finished_event = threading.Event()
+        self.dialog = None
+        self.thread = None
+
+    def start(self):
+        """Запуск задачи"""
+        self.dialog = ProgressDialog(self.parent, self.title, self.cancel)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.parent.after(self.POLL_INTERVAL, self.poll)
+        return self
+
+    def cancel(self):
+        """Запрос отмены задачи"""
+        self.cancel_event.set()
+        if self.dialog is not None:
+            self.dialog.text_var.set("Отмена...")
+
+    # Методы, вызываемые из рабочего потока
+
+    def check_cancelled(self):
+        """Прерывание работы, если пользователь нажал "Отмена\""""
+        if self.cancel_event.is_set():
+            raise TaskCancelled()
+
+    def put(self, message):
+        """Передача сообщения в окно (с ожиданием места в очереди)"""
+        while True:
+            self.check_cancelled()
+            try:
+                self.queue.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def report(self, done, total, text=None):
+        """Передача прогресса выполнения"""
+        self.put(('progress', done, total, text))
+
+    def send(self, chunk):
+        """Передача порции результата для обработки в окне"""
+        self.put(('chunk', chunk))
+
+    def run(self):
+        """Тело рабочего потока"""
+        try:
+            self.outcome = ('done', self.work(self))
+        except TaskCancelled:
+            self.outcome = ('cancelled',)
+        except Exception as e:
+            self.outcome = ('error', e)
+        self.finished_event.set()
+
+    # Методы, вызываемые в потоке Tk
+
+    def poll(self):
+        """Обработка накопившихся сообщений рабочего потока"""
+        if not self.parent.winfo_exists():
+            # Окно закрыто - останавливаем рабочий поток
+            self.cancel_event.set()
+            return
+
+        deadline = time.monotonic() + self.POLL_BUDGET
+
+        while time.monotonic() < deadline:
+            try:
+                message = self.queue.get_nowait()
+            except queue.Empty:
+                # Все сообщения обработаны - проверяем, завершился ли поток
+                if self.finished_event.is_set():
+                    self.finish()
+                    return
+                break
+
+            if message[0] == 'progress':
+                self.dialog.update(*message[1:])
+            elif not self.cancel_event.is_set() and self.on_chunk is not None:
+                self.on_chunk(message[1])
+
+        self.parent.after(self.POLL_INTERVAL, self.poll)
+
+    def finish(self):
+        """Завершение задачи и вызов обработчика результата"""
+        self.dialog.close()
+
+        kind = self.outcome[0]
+        if kind == 'error':
+            if self.on_error is not None:
+                self.on_error(self.outcome[1])
+        elif kind == 'done' and not self.cancel_event.is_set():
+            self.on_done(self.outcome[1])
+        elif self.on_cancel is not None:
+            self.on_cancel()
@@ -0,0 +1,310 @@
+"""
+Модуль резервных копий: базовые снимки файла и небольшие изменения (дельты) для каждого сохранения
+"""
+
+import csv
+import json
+import os
+import shutil
+from collections import defaultdict, deque
+from datetime import datetime
+from itertools import zip_longest
+
+from atomic_writer import atomic_open
+from dataset_cache import file_fingerprint
+
+# Суффикс каталога резервных копий рядом с файлом данных
+BACKUP_SUFFIX = ".backups"
+
+# Количество точек восстановления, после которого старые точки сворачиваются в базовый снимок
+COMPACT_AFTER = 50
+
+# Количество последних точек восстановления, сохраняемых при сворачивании
+KEEP_POINTS = 20
+
+# Поле, по которому строки сопоставляются между сохранениями
+KEY_FIELD = "browser_id"
+
+# Количество строк без пары при сравнении, после которого вместо дельты записывается новый снимок
+MAX_UNMATCHED = 100000
+
+
+def file_rows(path):
+    """Поток строк CSV файла без заголовков (строки приводятся к числу заголовков, как при загрузке таблицы)"""
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        reader = csv.reader(file)
+        width = len(next(reader, []))
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != width:
+                row = (row + [''] * width)[:width]
+            yield row
+
+
+def apply_delta(rows, delta):
+    """Поток строк после применения дельты к потоку строк предыдущей точки
+
+    Удаленные и измененные строки задаются номерами строк в предыдущей точке, новые строки
+    дописываются в конец
+    """
+    deleted = set(delta["deleted"])
+    changed = {position: row for position, row in delta["changed"]}
+    for position, row in enumerate(rows):
+        if position in deleted:
+            continue
+        yield changed.get(position, row)
+    yield from delta["added"]
+
+
+def diff_rows(old_rows, new_rows, key_position):
+    """Дельта, переводящая поток old_rows в поток new_rows
+
+    Строки сопоставляются по ключу при одновременном чтении обоих потоков, поэтому в памяти
+    остаются только строки, еще не нашедшие пары. Возвращает None, если таких строк слишком много
+    """
+    def key(row):
+        return row[key_position] if key_position is not None else ""
+
+    # Строки без пары по ключам: (номер строки в своем потоке, строка)
+    old_unmatched = defaultdict(deque)
+    new_unmatched = defaultdict(deque)
+    unmatched = 0
+    changed = []
+
+    for old, new in zip_longest(enumerate(old_rows), enumerate(new_rows)):
+        if old is not None:
+            waiting = new_unmatched.get(key(old[1]))
+            if waiting:
+                _, row = waiting.popleft()
+                if not waiting:
+                    del new_unmatched[key(old[1])]
+                if row != old[1]:
+                    changed.append([old[0], row])
+                unmatched -= 1
+            else:
+                old_unmatched[key(old[1])].append(old)
+                unmatched += 1
+
+        if new is not None:
+            waiting = old_unmatched.get(key(new[1]))
+            if waiting:
+                position, row = waiting.popleft()
+                if not waiting:
+                    del old_unmatched[key(new[1])]
+                if row != new[1]:
+                    changed.append([position, new[1]])
+                unmatched -= 1
+            else:
+                new_unmatched[key(new[1])].append(new)
+                unmatched += 1
+
+        if unmatched > MAX_UNMATCHED:
+            return None
+
+    changed.sort()
+    added = sorted(item for items in new_unmatched.values() for item in items)
+    return {
+        "deleted": sorted(position for items in old_unmatched.values() for position, _ in items),
+        "changed": changed,
+        "added": [row for _, row in added]
+    }
+
+
+class BackupStore:
+    """Хранилище резервных копий файла: цепочка точек восстановления из базовых снимков и дельт
+    добавленных, удаленных и измененных строк"""
+
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        self.directory = self.filename + BACKUP_SUFFIX
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+        self.manifest = self.read_manifest()
+
+    def read_manifest(self):
+        """Чтение описания цепочки резервных копий"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return manifest if "points" in manifest and "files" in manifest else None
+
+    def write_manifest(self):
+        """Запись описания цепочки резервных копий"""
+        with atomic_open(self.manifest_path) as file:
+            json.dump(self.manifest, file, ensure_ascii=False, indent=1)
+
+    def key_position(self):
+        """Номер поля, по которому сопоставляются строки"""
+        headers = self.manifest["headers"]
+        return headers.index(KEY_FIELD) if KEY_FIELD in headers else None
+
+    def begin(self, headers):
+        """Подготовка к сохранению файла (вызывается до записи файла)
+
+        Если цепочки еще нет или изменились заголовки, текущий файл становится базовым снимком.
+        Если файл изменился не через хранилище (в других окнах), его изменения записываются
+        отдельной точкой восстановления
+        """
+        headers = list(headers)
+        if self.manifest is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.manifest = {"headers": headers, "fingerprint": None, "points": [], "files": 0}
+            self.add_base("Базовый снимок")
+        elif self.manifest["headers"] != headers:
+            self.manifest["headers"] = headers
+            self.add_base("Базовый снимок (изменились заголовки)")
+        elif self.manifest["fingerprint"] != list(file_fingerprint(self.filename)):
+            self.record("Изменения в других окнах")
+
+    def add_base(self, description):
+        """Новая точка восстановления - полная копия текущего файла (прежние точки сохраняются)"""
+        name = self.new_file_name("base", "csv")
+        with open(self.filename, 'rb') as source, atomic_open(os.path.join(self.directory, name), 'wb') as target:
+            shutil.copyfileobj(source, target)
+
+        self.add_point({
+            "file": name,
+            "kind": "base",
+            "time": datetime.now().isoformat(timespec='seconds'),
+            "description": description
+        })
+
+    def new_file_name(self, kind, extension):
+        """Имя нового файла цепочки (номера файлов не повторяются и после сворачивания точек)"""
+        self.manifest["files"] += 1
+        return f"{kind}_{self.manifest['files']:05d}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+    def add_point(self, info):
+        """Добавление точки восстановления в описание цепочки"""
+        self.manifest["points"].append(info)
+        self.manifest["fingerprint"] = list(file_fingerprint(self.filename))
+        if len(self.manifest["points"]) > COMPACT_AFTER:
+            self.compact()
+        self.write_manifest()
+
+    def commit(self, added=(), deleted=(), changed=()):
+        """Запись дельты после сохранения файла
+
+        added - новые строки, deleted - номера удаленных строк последней точки,
+        changed - пары (номер строки последней точки, новая строка)
+        """
+        delta = {
+            "added": [list(row) for row in added],
+            "deleted": sorted(deleted),
+            "changed": sorted([position, list(row)] for position, row in changed)
+        }
+
+        name = self.new_file_name("delta", "json")
+        with atomic_open(os.path.join(self.directory, name)) as file:
+            json.dump(delta, file, ensure_ascii=False)
+
+        self.add_point({
+            "file": name,
+            "kind": "delta",
+            "time": datetime.now().isoformat(timespec='seconds'),
+            "added": len(delta["added"]),
+            "deleted": len(delta["deleted"]),
+            "changed": len(delta["changed"])
+        })
+        return name
+
+    def record(self, description="Базовый снимок"):
+        """Запись изменений файла относительно последней точки восстановления
+
+        Файл и последняя точка сравниваются потоками. Если строки переставлены или различий слишком
+        много, вместо дельты сохраняется новый базовый снимок
+        """
+        last = len(self.manifest["points"]) - 1
+        delta = diff_rows(self.rows(last), file_rows(self.filename), self.key_position())
+        if delta is not None:
+            # Дельта восстанавливает и порядок строк, только если новые строки оказались в конце файла
+            restored = apply_delta(self.rows(last), delta)
+            if all(old == new for old, new in zip_longest(restored, file_rows(self.filename))):
+                if delta["added"] or delta["deleted"] or delta["changed"]:
+                    self.commit(**delta)
+                else:
+                    self.manifest["fingerprint"] = list(file_fingerprint(self.filename))
+                    self.write_manifest()
+                return
+        self.add_base(description)
+
+    def points(self):
+        """Точки восстановления: (номер, время, описание)"""
+        if self.manifest is None:
+            return []
+        points = []
+        for number, info in enumerate(self.manifest["points"]):
+            if info["kind"] == "base":
+                description = info["description"]
+            else:
+                description = f"+{info['added']} / -{info['deleted']} / изменено {info['changed']}"
+            points.append((number, info["time"], description))
+        return points
+
+    def read_delta(self, info):
+        """Чтение дельты"""
+        with open(os.path.join(self.directory, info["file"]), 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def rows(self, point):
+        """Поток строк файла в точке восстановления: ближайший предыдущий снимок и дельты после него"""
+        points = self.manifest["points"]
+        base = point
+        while points[base]["kind"] != "base":
+            base -= 1
+
+        rows = file_rows(os.path.join(self.directory, points[base]["file"]))
+        for info in points[base + 1:point + 1]:
+            rows = apply_delta(rows, self.read_delta(info))
+        return rows
+
+    def headers(self, point):
+        """Заголовки файла в точке восстановления (заголовки снимка, на котором она основана)"""
+        points = self.manifest["points"]
+        base = point
+        while points[base]["kind"] != "base":
+            base -= 1
+        with open(os.path.join(self.directory, points[base]["file"]), 'r', encoding='utf-8', newline='') as file:
+            return next(csv.reader(file), [])
+
+    def write_point(self, point, path):
+        """Запись содержимого точки восстановления в файл"""
+        with atomic_open(path) as file:
+            writer = csv.writer(file)
+            writer.writerow(self.headers(point))
+            writer.writerows(self.rows(point))
+
+    def restore(self, point):
+        """Восстановление файла в состояние точки восстановления (само восстановление тоже записывается)"""
+        headers = self.headers(point)
+        self.write_point(point, self.filename)
+        if headers != self.manifest["headers"]:
+            self.manifest["headers"] = headers
+            self.add_base(f"Восстановление точки {point}")
+        else:
+            self.record(f"Восстановление точки {point}")
+
+    def compact(self):
+        """Сворачивание старых точек: остаются последние KEEP_POINTS точек, первая из них - снимок"""
+        points = self.manifest["points"]
+        cut = len(points) - KEEP_POINTS
+        if cut <= 0:
+            return
+
+        first = points[cut]
+        if first["kind"] != "base":
+            name = self.new_file_name("base", "csv")
+            self.write_point(cut, os.path.join(self.directory, name))
+            first = {"file": name, "kind": "base", "time": first["time"], "description": "Базовый снимок"}
+
+        old_files = [info["file"] for info in points[:cut + 1] if info["file"] != first["file"]]
+        self.manifest["points"] = [first] + points[cut + 1:]
+        self.write_manifest()
+
+        for name in old_files:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
@@ -0,0 +1,234 @@
+"""
+Модуль потоковых массовых операций над CSV файлом (без загрузки файла в память)
+"""
+
+import csv
+import multiprocessing
+import operator
+import os
+import queue
+
+from atomic_writer import atomic_open
+from background_task import TaskCancelled
+from sort_keys import sort_key
+
+# Операции сравнения в условиях: значения сравниваются по ключам сортировки поля
+# (даты как даты, версии по номерам, ID как числа, остальное без учета регистра)
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "содержит": None
+}
+
+# Через сколько строк сообщать о прогрессе и проверять отмену
+REPORT_ROWS = 10000
+
+
+def make_predicate(headers, conditions):
+    """Функция проверки строки (списка значений) по условиям (поле, операция, значение), объединенным через И"""
+    checks = []
+    for field, op, value in conditions:
+        if field not in headers:
+            raise ValueError(f"В файле нет поля '{field}'")
+        if op not in OPERATORS:
+            raise ValueError(f"Неизвестная операция '{op}'")
+
+        if op == "содержит":
+            text = value.lower()
+
+            def check(item, text=text):
+                return text in item.lower()
+        else:
+            compare = OPERATORS[op]
+            target = sort_key(field, value)
+            # Ключ пустого значения: так же выглядят ключи значений, которые не удалось разобрать
+            # (например, неверных дат), и такие значения не подходят под сравнения на больше/меньше
+            invalid = sort_key(field, "") if op in ("<", "<=", ">", ">=") else None
+
+            def check(item, field=field, compare=compare, target=target, invalid=invalid):
+                key = sort_key(field, item)
+                if invalid is not None and key == invalid:
+                    return False
+                return compare(key, target)
+
+        # Результат проверки запоминается для каждого различного значения поля
+        checks.append((headers.index(field), check, {}))
+
+    def predicate(row):
+        for position, check, results in checks:
+            item = row[position]
+            result = results.get(item)
+            if result is None:
+                result = check(item)
+                if len(results) < 100000:
+                    results[item] = result
+            if not result:
+                return False
+        return True
+
+    return predicate
+
+
+class BulkOperation:
+    """Потоковая обработка файла: строки читаются по одной, результат записывается с атомарной заменой файла"""
+
+    def __init__(self, filename, conditions, encoding='utf-8'):
+        self.filename = filename
+        self.conditions = list(conditions)
+        self.encoding = encoding
+        self.headers = []
+        self.predicate = None
+
+    def rows(self, file, task, text):
+        """Чтение заголовков и условий, возвращает генератор строк файла"""
+        reader = csv.reader(file)
+        self.headers = next(reader, [])
+        self.prepare()
+        return self.read_rows(reader, file, task, text)
+
+    def prepare(self):
+        """Подготовка операции после чтения заголовков (ошибки условий выявляются до обработки строк)"""
+        self.predicate = make_predicate(self.headers, self.conditions)
+
+    def read_rows(self, reader, file, task, text):
+        """Строки файла, приведенные к числу заголовков так же, как при загрузке в таблицу"""
+        total = os.path.getsize(self.filename)
+        width = len(self.headers)
+
+        for count, row in enumerate(reader, 1):
+            if not row:
+                continue
+            if len(row) < width:
+                row = row + [''] * (width - len(row))
+            elif len(row) > width:
+                row = row[:width]
+            yield row
+
+            if task is not None and count % REPORT_ROWS == 0:
+                task.report(file.buffer.tell(), total, f"{text}: {count} строк")
+
+    def apply(self, row):
+        """Результат обработки подходящей под условия строки (None - строка удаляется);
+        сама операция оставляет строки без изменений и подходит для подсчета строк"""
+        return row
+
+    def preview(self, task=None):
+        """Подсчет строк, подходящих под условия: (подходящих, всего)"""
+        matched = total = 0
+        with open(self.filename, 'r', encoding=self.encoding, newline='') as file:
+            for row in self.rows(file, task, "Подсчет"):
+                total += 1
+                if self.predicate(row):
+                    matched += 1
+        return matched, total
+
+    def run(self, task=None):
+        """Выполнение операции: (обработано строк, записано строк)"""
+        affected = written = 0
+        with open(self.filename, 'r', encoding=self.encoding, newline='') as source:
+            with atomic_open(self.filename, encoding=self.encoding) as target:
+                writer = csv.writer(target)
+                rows = self.rows(source, task, "Обработка")
+                writer.writerow(self.headers)
+
+                for row in rows:
+                    if self.predicate(row):
+                        affected += 1
+                        row = self.apply(row)
+                        if row is None:
+                            continue
+                    writer.writerow(row)
+                    written += 1
+        return affected, written
+
+
+class BulkDelete(BulkOperation):
+    """Удаление всех строк, подходящих под условия"""
+
+    def apply(self, row):
+        return None
+
+
+class BulkUpdate(BulkOperation):
+    """Присваивание значений полям во всех строках, подходящих под условия"""
+
+    def __init__(self, filename, conditions, assignments, encoding='utf-8'):
+        super().__init__(filename, conditions, encoding)
+        self.assignments = dict(assignments)
+        self.positions = []
+
+    def prepare(self):
+        super().prepare()
+        for field in self.assignments:
+            if field not in self.headers:
+                raise ValueError(f"В файле нет поля '{field}'")
+        self.positions = [(self.headers.index(field), value) for field, value in self.assignments.items()]
+
+    def apply(self, row):
+        for position, value in self.positions:
+            row[position] = value
+        return row
+
+
+class ProcessReporter:
+    """Передача прогресса из рабочего процесса (с теми же методами, что у фоновой задачи)"""
+
+    def __init__(self, messages, cancel_event):
+        self.messages = messages
+        self.cancel_event = cancel_event
+
+    def report(self, done, total, text=None):
+        if self.cancel_event.is_set():
+            raise TaskCancelled()
+        try:
+            self.messages.put_nowait(('progress', done, total, text))
+        except queue.Full:
+            pass
+
+
+def process_main(operation, method, messages, cancel_event):
+    """Тело рабочего процесса: выполнение метода операции и передача результата"""
+    try:
+        result = getattr(operation, method)(ProcessReporter(messages, cancel_event))
+        messages.put(('done', result))
+    except TaskCancelled:
+        messages.put(('cancelled',))
+    except Exception as e:
+        messages.put(('error', str(e)))
+
+
+def run_in_process(operation, method, task):
+    """Выполнение метода операции в отдельном процессе (вызывается из рабочего потока фоновой задачи,
+    которая передает прогресс в окно и отменяет процесс по кнопке "Отмена")"""
+    messages = multiprocessing.Queue(maxsize=64)
+    cancel_event = multiprocessing.Event()
+    process = multiprocessing.Process(target=process_main, args=(operation, method, messages, cancel_event),
+                                      daemon=True)
+    process.start()
+
+    try:
+        while True:
+            try:
+                message = messages.get(timeout=0.1)
+            except queue.Empty:
+                task.check_cancelled()
+                if not process.is_alive() and messages.empty():
+                    raise RuntimeError("Рабочий процесс неожиданно завершился")
+                continue
+
+            if message[0] == 'progress':
+                task.report(*message[1:])
+            elif message[0] == 'done':
+                return message[1]
+            elif message[0] == 'cancelled':
+                raise TaskCancelled()
+            else:
+                raise RuntimeError(message[1])
+    finally:
+        # При отмене процесс сам удаляет временный файл, поэтому дожидаемся его завершения
+        cancel_event.set()
+        process.join()
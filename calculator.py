@@ -4,18 +4,22 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import csv
 import os
 from datetime import datetime
 from collections import defaultdict
 import statistics
 
+from dataset_cache import DatasetCache
+from version_parser import major_version
+
 
 class Calculator:
     """Класс для расчета показателей по данным браузеров"""
 
-    def __init__(self, parent):
+    def __init__(self, parent, datasets=None):
         self.parent = parent
+        # Общий кэш загруженных наборов данных
+        self.datasets = datasets if datasets is not None else DatasetCache()
         self.window = None
         self.data = []
         self.results = {}
@@ -103,18 +107,23 @@ class Calculator:
             )
 
             if file_path:
-                self.data = []
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    reader = csv.DictReader(file)
-                    for row in reader:
-                        self.data.append(row)
-
-                self.status_var.set(f"Загружено {len(self.data)} записей из файла")
-                messagebox.showinfo("Успех", f"Файл загружен успешно!\nЗагружено записей: {len(self.data)}")
+                self.datasets.load(self.window, file_path, self.on_data_loaded, on_error=self.on_load_error,
+                                   on_cancel=lambda: self.status_var.set("Загрузка отменена"))
 
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка загрузки файла: {str(e)}")
-            self.status_var.set("Ошибка загрузки файла")
+            self.on_load_error(e)
+
+    def on_data_loaded(self, table):
+        """Обработка загруженных данных"""
+        self.data = table
+
+        self.status_var.set(f"Загружено {len(self.data)} записей из файла")
+        messagebox.showinfo("Успех", f"Файл загружен успешно!\nЗагружено записей: {len(self.data)}")
+
+    def on_load_error(self, error):
+        """Обработка ошибки загрузки"""
+        messagebox.showerror("Ошибка", f"Ошибка загрузки файла: {str(error)}")
+        self.status_var.set("Ошибка загрузки файла")
 
     def calculate_metrics(self):
         """Расчет всех показателей"""
@@ -225,14 +234,11 @@ class Calculator:
         """Анализ версий"""
         version_info = []
 
-        for row in self.data:
-            version = row['latest_version']
-            try:
-                # Пытаемся извлечь числовую часть версии
-                major_version = float(version.split('.')[0])
-                version_info.append(major_version)
-            except:
-                continue
+        for version in self.data.column_values('latest_version'):
+            # Числовая часть версии (разобранные версии кэшируются)
+            major = major_version(version)
+            if major is not None:
+                version_info.append(float(major))
 
         if version_info:
             self.results['versions'] = {
@@ -11,12 +11,17 @@ import numpy as np
 from collections import Counter
 import os
 
+from dataset_cache import DatasetCache
+from version_parser import major_version
+
 
 class ChartViewer:
     """Класс для просмотра графиков по данным браузеров"""
 
-    def __init__(self, root):
+    def __init__(self, root, datasets=None):
         self.root = root
+        # Общий кэш загруженных наборов данных
+        self.datasets = datasets if datasets is not None else DatasetCache()
         self.window = None
         self.data = None
         self.canvas = None
@@ -112,25 +117,40 @@ class ChartViewer:
             )
 
             if file_path:
-                # Загружаем данные
-                self.data = pd.read_csv(file_path, encoding='utf-8')
+                # Загружаем данные (таблица берется из общего кэша или читается в фоне)
+                self.datasets.load(self.window, file_path, self.on_data_loaded, on_error=self.on_load_error,
+                                   on_cancel=lambda: self.status_var.set("Загрузка отменена"))
+
+        except Exception as e:
+            self.on_load_error(e)
 
-                # Проверяем наличие необходимых колонок
-                required_columns = ['browser_name', 'developer', 'release_date', 'engine']
-                missing_columns = [col for col in required_columns if col not in self.data.columns]
+    def on_data_loaded(self, table):
+        """Обработка загруженных данных"""
+        try:
+            self.data = pd.DataFrame(
+                {header: table.column_values(header) for header in table.headers}
+            ).replace('', np.nan)
+
+            # Проверяем наличие необходимых колонок
+            required_columns = ['browser_name', 'developer', 'release_date', 'engine']
+            missing_columns = [col for col in required_columns if col not in self.data.columns]
 
-                if missing_columns:
-                    messagebox.showwarning("Предупреждение",
-                                           f"В файле отсутствуют колонки: {', '.join(missing_columns)}")
+            if missing_columns:
+                messagebox.showwarning("Предупреждение",
+                                       f"В файле отсутствуют колонки: {', '.join(missing_columns)}")
 
-                # Обработка данных
-                self.process_data()
+            # Обработка данных
+            self.process_data()
 
-                self.status_var.set(f"Загружено записей: {len(self.data)}")
-                messagebox.showinfo("Успех", f"Файл успешно загружен!\nКоличество записей: {len(self.data)}")
+            self.status_var.set(f"Загружено записей: {len(self.data)}")
+            messagebox.showinfo("Успех", f"Файл успешно загружен!\nКоличество записей: {len(self.data)}")
 
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка загрузки файла:\n{str(e)}")
+            self.on_load_error(e)
+
+    def on_load_error(self, error):
+        """Обработка ошибки загрузки"""
+        messagebox.showerror("Ошибка", f"Ошибка загрузки файла:\n{str(error)}")
 
     def process_data(self):
         """Обработка данных после загрузки"""
@@ -265,8 +285,8 @@ class ChartViewer:
             if 'latest_version' in self.data.columns:
                 # Анализ основных версий (первая цифра)
                 versions = self.data['latest_version'].dropna().astype(str)
-                major_versions = [v.split('.')[0] for v in versions if v.split('.')[0].isdigit()]
-                version_counts = Counter(major_versions)
+                majors = (major_version(v) for v in versions)
+                version_counts = Counter(str(major) for major in majors if major is not None)
 
                 # Берем топ-10 версий
                 top_versions = dict(sorted(version_counts.items(),
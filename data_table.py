@@ -0,0 +1,390 @@
+"""
+Модуль колоночной таблицы в памяти для данных о браузерах
+"""
+
+import csv
+import sys
+from array import array
+from collections.abc import Mapping
+from itertools import compress, islice
+
+# Колонка с почти уникальными значениями хранится без словаря: минимальное число строк для проверки
+# и доля различных значений, начиная с которой словарь только занимает память
+PACK_MIN_ROWS = 5000
+PACK_RATIO = 0.5
+
+
+class Column:
+    """Колонка таблицы со словарным кодированием значений
+
+    Коды значений только добавляются, поэтому пара (values, копия codes) - снимок колонки
+    """
+
+    __slots__ = ('values', 'codes', 'lookup')
+
+    def __init__(self):
+        # Различные значения колонки и код значения для каждой строки
+        self.values = []
+        self.codes = array('I')
+        self.lookup = {}
+
+    def encode(self, value):
+        """Получение кода значения (новое значение добавляется в словарь)"""
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            value = sys.intern(value)
+            self.lookup[value] = code
+            self.values.append(value)
+        return code
+
+    def append(self, value):
+        """Добавление значения в конец колонки"""
+        self.codes.append(self.encode(value))
+
+    def codes_of(self, value):
+        """Коды, под которыми значение хранится в колонке"""
+        code = self.lookup.get(value)
+        return () if code is None else (code,)
+
+    def __getitem__(self, row_id):
+        return self.values[self.codes[row_id]]
+
+    def __setitem__(self, row_id, value):
+        self.codes[row_id] = self.encode(value)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def memory_usage(self):
+        """Приблизительный объем памяти колонки в байтах"""
+        size = self.codes.itemsize * len(self.codes) + sys.getsizeof(self.values) + sys.getsizeof(self.lookup)
+        return size + sum(sys.getsizeof(value) for value in self.values)
+
+
+def integer_value(value):
+    """Целое число, если значение - его обычная запись (без ведущих нулей и пробелов), иначе None"""
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    if -2 ** 63 <= number < 2 ** 63 and str(number) == value:
+        return number
+    return None
+
+
+class PackedValues:
+    """Последовательность значений без отдельных объектов строк: целые числа хранятся в массиве,
+    а при первом нечисловом значении все значения переносятся в общий буфер байтов UTF-8"""
+
+    __slots__ = ('numbers', 'text', 'ends')
+
+    def __init__(self):
+        self.numbers = array('q')
+        # Буфер текста и смещения концов значений в нем (используются вместо numbers)
+        self.text = None
+        self.ends = None
+
+    def to_text(self):
+        """Перенос числовых значений в текстовый буфер"""
+        # Буфер заполняется до переключения: значения могут читаться из рабочего потока (снимок колонки)
+        text = bytearray()
+        ends = array('Q')
+        for number in self.numbers:
+            text += str(number).encode('ascii')
+            ends.append(len(text))
+        self.text = text
+        self.ends = ends
+        self.numbers = None
+
+    def append(self, value):
+        """Добавление значения в конец"""
+        if self.numbers is not None:
+            number = integer_value(value)
+            if number is not None:
+                self.numbers.append(number)
+                return
+            self.to_text()
+
+        self.text += value.encode('utf-8')
+        self.ends.append(len(self.text))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        numbers = self.numbers
+        if numbers is not None:
+            return str(numbers[index])
+
+        ends = self.ends
+        if index < 0:
+            index += len(ends)
+        start = ends[index - 1] if index else 0
+        return self.text[start:ends[index]].decode('utf-8')
+
+    def __len__(self):
+        if self.numbers is not None:
+            return len(self.numbers)
+        return len(self.ends)
+
+    def __iter__(self):
+        if self.numbers is not None:
+            return map(str, self.numbers)
+        return map(self.__getitem__, range(len(self.ends)))
+
+    def memory_usage(self):
+        """Приблизительный объем памяти в байтах"""
+        if self.numbers is not None:
+            return self.numbers.itemsize * len(self.numbers)
+        return len(self.text) + self.ends.itemsize * len(self.ends)
+
+
+class PackedColumn:
+    """Колонка без словаря для полей с почти уникальными значениями (ID, названия, версии)
+
+    Интерфейс тот же, что у Column, но одинаковые значения могут иметь разные коды:
+    каждое записанное значение получает новый код, а словаря значений (lookup) нет
+    """
+
+    __slots__ = ('values', 'codes')
+
+    lookup = None
+
+    def __init__(self):
+        self.values = PackedValues()
+        self.codes = array('I')
+
+    @classmethod
+    def from_column(cls, column):
+        """Перенос значений колонки со словарем (строки с одинаковыми значениями сохраняют общий код)"""
+        packed = cls()
+        for value in column.values:
+            packed.values.append(value)
+        packed.codes = column.codes
+        return packed
+
+    def encode(self, value):
+        """Получение кода для нового значения"""
+        self.values.append(value)
+        return len(self.values) - 1
+
+    def append(self, value):
+        """Добавление значения в конец колонки"""
+        self.codes.append(self.encode(value))
+
+    def codes_of(self, value):
+        """Коды, под которыми значение хранится в колонке (словаря нет - значения просматриваются)"""
+        return tuple(code for code, item in enumerate(self.values) if item == value)
+
+    def __getitem__(self, row_id):
+        return self.values[self.codes[row_id]]
+
+    def __setitem__(self, row_id, value):
+        self.codes[row_id] = self.encode(value)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def memory_usage(self):
+        """Приблизительный объем памяти колонки в байтах"""
+        return self.codes.itemsize * len(self.codes) + self.values.memory_usage()
+
+
+class RowView(Mapping):
+    """Представление строки таблицы в виде словаря (без копирования данных)"""
+
+    __slots__ = ('table', 'row_id')
+
+    def __init__(self, table, row_id):
+        self.table = table
+        self.row_id = row_id
+
+    def __getitem__(self, field):
+        column = self.table.columns.get(field)
+        if column is None:
+            raise KeyError(field)
+        return column[self.row_id]
+
+    def __iter__(self):
+        return iter(self.table.headers)
+
+    def __len__(self):
+        return len(self.table.headers)
+
+    def copy(self):
+        """Копия строки в виде обычного словаря"""
+        return dict(self)
+
+    def __repr__(self):
+        return f"RowView({self.row_id}, {dict(self)!r})"
+
+
+class DataTable:
+    """Колоночная таблица: по одной закодированной колонке на каждое поле"""
+
+    def __init__(self, headers):
+        self.headers = list(headers)
+        self.columns = {header: Column() for header in self.headers}
+        # Количество строк с учетом удаленных: id строки не меняется при удалении других строк
+        self.size = 0
+        # Признак существования строки (0 - строка удалена) и количество живых строк
+        self.live = bytearray()
+        self.live_count = 0
+        # Признак изменений, не записанных в файл
+        self.modified = False
+        # Номер версии данных и индексы таблицы. Версия меняется при добавлении и изменении строк,
+        # но не при удалении: индексы сами пропускают удаленные строки
+        self.version = 0
+        self.indexes = {}
+        # Смещения строк в файле, из которого загружена таблица (None, если неизвестны)
+        self.offsets = None
+        # Отпечаток файла при загрузке или последней записи таблицы (None, если неизвестен)
+        self.fingerprint = None
+
+    @classmethod
+    def from_csv(cls, filename, encoding='utf-8'):
+        """Загрузка таблицы из CSV файла"""
+        with open(filename, 'r', encoding=encoding, newline='') as file:
+            reader = csv.reader(file)
+            headers = next(reader, [])
+            table = cls(headers)
+            # Способ хранения колонок выбирается по первым строкам, до загрузки остальных
+            table.extend(islice(reader, PACK_MIN_ROWS))
+            table.extend(reader)
+        table.modified = False
+        return table
+
+    def __len__(self):
+        return self.live_count
+
+    def __iter__(self):
+        for row_id in self.row_ids():
+            yield RowView(self, row_id)
+
+    def __getitem__(self, row_id):
+        if not 0 <= row_id < self.size:
+            raise IndexError(row_id)
+        return RowView(self, row_id)
+
+    def row_ids(self):
+        """Идентификаторы всех неудаленных строк таблицы"""
+        if self.live_count == self.size:
+            return range(self.size)
+        return list(compress(range(self.size), self.live))
+
+    def is_live(self, row_id):
+        """Проверка, что строка существует и не удалена"""
+        return 0 <= row_id < self.size and self.live[row_id] == 1
+
+    def live_rows(self, row_ids):
+        """Неудаленные строки из последовательности id (порядок сохраняется)"""
+        if self.live_count == self.size:
+            return row_ids
+        return list(compress(row_ids, map(self.live.__getitem__, row_ids)))
+
+    def value(self, row_id, field):
+        """Значение поля в строке"""
+        return self.columns[field][row_id]
+
+    def row_values(self, row_id):
+        """Значения строки в порядке заголовков"""
+        return [self.columns[header][row_id] for header in self.headers]
+
+    def column_values(self, field):
+        """Значения колонки по всем неудаленным строкам"""
+        column = self.columns[field]
+        values = column.values
+        codes = column.codes
+        if self.live_count != self.size:
+            codes = compress(codes, self.live)
+        return [values[code] for code in codes]
+
+    def extend(self, rows):
+        """Добавление строк, заданных списками значений в порядке заголовков"""
+        columns = [self.columns[header] for header in self.headers]
+        width = len(columns)
+        added = 0
+        for row in rows:
+            if not row:
+                continue
+            if len(row) < width:
+                row = list(row) + [''] * (width - len(row))
+            for column, value in zip(columns, row):
+                column.append(value)
+            self.live.append(1)
+            added += 1
+        self.size += added
+        self.live_count += added
+        self.version += 1
+        self.modified = True
+        self.pack_columns()
+
+    def pack_columns(self):
+        """Перевод колонок с почти уникальными значениями в хранение без словаря
+
+        Выполняется при загрузке, пока у таблицы нет индексов, ссылающихся на коды значений
+        """
+        if self.indexes or self.size < PACK_MIN_ROWS:
+            return
+        for header, column in self.columns.items():
+            if column.lookup is not None and len(column.values) > PACK_RATIO * len(column):
+                self.columns[header] = PackedColumn.from_column(column)
+
+    def append(self, record):
+        """Добавление записи (словаря) в конец таблицы, возвращает id строки"""
+        for header in self.headers:
+            self.columns[header].append(record.get(header) or '')
+        self.live.append(1)
+        self.size += 1
+        self.live_count += 1
+        self.version += 1
+        self.modified = True
+        return self.size - 1
+
+    def update(self, row_id, record):
+        """Замена значений строки значениями из записи"""
+        for header in self.headers:
+            if header in record:
+                self.columns[header][row_id] = record[header] or ''
+        self.version += 1
+        self.modified = True
+
+        # Индексы, которые поддерживаются построчно, узнают об изменении сразу
+        for index in self.indexes.values():
+            on_update = getattr(index, 'on_update', None)
+            if on_update is not None:
+                on_update(row_id)
+
+    def delete(self, row_ids):
+        """Удаление строк по их идентификаторам (id остальных строк не меняются)"""
+        live = self.live
+        deleted = 0
+        for row_id in row_ids:
+            if live[row_id]:
+                live[row_id] = 0
+                deleted += 1
+        if deleted:
+            self.live_count -= deleted
+            self.modified = True
+        return deleted
+
+    def clear(self):
+        """Удаление всех строк"""
+        self.columns = {header: Column() for header in self.headers}
+        self.size = 0
+        self.live = bytearray()
+        self.live_count = 0
+        self.indexes.clear()
+        self.version += 1
+        self.modified = True
+
+    def get_index(self, key, factory):
+        """Индекс таблицы по ключу (создается функцией factory(table) при первом обращении)"""
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.indexes[key] = factory(self)
+        return index
+
+    def memory_usage(self):
+        """Приблизительный объем памяти таблицы в байтах"""
+        return sum(column.memory_usage() for column in self.columns.values()) + len(self.live)
@@ -0,0 +1,258 @@
+"""
+Модуль кэша загруженных наборов данных (общий для всех окон приложения)
+"""
+
+import csv
+import hashlib
+import os
+from array import array
+from collections import OrderedDict
+
+from background_task import BackgroundTask
+from data_table import DataTable
+
+# Размер блока файла, участвующего в хэше содержимого
+SAMPLE_SIZE = 256 * 1024
+
+# Лимит памяти кэша по умолчанию (байт)
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# Количество строк в одной порции при фоновой загрузке
+CHUNK_ROWS = 5000
+
+# Таблицы с открытым журналом изменений по ключам файлов: пока файл соответствует таблице,
+# все окна получают ее, даже если в ней есть несохраненные изменения или она вытеснена из кэша
+JOURNALED_TABLES = {}
+
+
+def file_fingerprint(filename):
+    """Отпечаток файла: время изменения, размер и хэш содержимого"""
+    stat = os.stat(filename)
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(filename, 'rb') as file:
+        if stat.st_size <= 3 * SAMPLE_SIZE:
+            digest.update(file.read())
+        else:
+            # Для больших файлов хэшируем начало, середину и конец
+            for offset in (0, (stat.st_size - SAMPLE_SIZE) // 2, stat.st_size - SAMPLE_SIZE):
+                file.seek(offset)
+                digest.update(file.read(SAMPLE_SIZE))
+
+    return (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+
+
+def spread_offsets(size, rows, offsets, end):
+    """Смещения строк таблицы по id строк
+
+    rows - id строк в порядке записи в файл (по возрастанию), offsets - смещения этих строк,
+    end - размер файла. Удаленным строкам достается смещение следующей строки файла (место
+    нулевой длины), поэтому место строки в файле - от ее смещения до смещения следующего id
+    """
+    if len(rows) == size:
+        return array('Q', offsets)
+
+    result = array('Q', bytes(8 * size))
+    following = end
+    position = len(rows) - 1
+    for row_id in range(size - 1, -1, -1):
+        if position >= 0 and rows[position] == row_id:
+            following = offsets[position]
+            position -= 1
+        result[row_id] = following
+    return result
+
+
+class OffsetWriter:
+    """Обертка текстового файла для csv.writer, запоминающая смещение каждой записанной строки (байт)
+
+    csv.writer передает каждую строку одним вызовом write, поэтому смещения считаются по длине
+    закодированных строк без обращений к tell()
+    """
+
+    def __init__(self, file, start=0, encoding='utf-8'):
+        self.file = file
+        self.encoding = encoding
+        # Смещение следующей записываемой строки и смещения записанных строк
+        self.position = start
+        self.offsets = array('Q')
+
+    def write(self, text):
+        self.offsets.append(self.position)
+        self.position += len(text.encode(self.encoding))
+        return self.file.write(text)
+
+
+class CacheEntry:
+    """Запись кэша: таблица, отпечаток файла и занимаемая память"""
+
+    __slots__ = ('table', 'fingerprint', 'size')
+
+    def __init__(self, table, fingerprint, size):
+        self.table = table
+        self.fingerprint = fingerprint
+        self.size = size
+
+
+class DatasetCache:
+    """Реестр разобранных CSV файлов с проверкой актуальности и вытеснением LRU"""
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.entries = OrderedDict()
+        self.used_memory = 0
+
+    @staticmethod
+    def make_key(filename):
+        """Ключ кэша для пути к файлу"""
+        return os.path.normcase(os.path.abspath(filename))
+
+    def lookup(self, filename, fingerprint):
+        """Таблица из кэша, если файл не изменился с момента загрузки"""
+        key = self.make_key(filename)
+        table = JOURNALED_TABLES.get(key)
+        if table is not None and table.fingerprint == fingerprint:
+            return table
+
+        entry = self.entries.get(key)
+        if entry is not None and entry.fingerprint == fingerprint and not entry.table.modified:
+            self.entries.move_to_end(key)
+            return entry.table
+        return None
+
+    def get(self, filename):
+        """Получение таблицы для файла (из кэша, если файл не изменился)"""
+        fingerprint = file_fingerprint(filename)
+        table = self.lookup(filename, fingerprint)
+        if table is None:
+            table = DataTable.from_csv(filename)
+            self.put(filename, table, fingerprint)
+        return table
+
+    def load(self, parent, filename, on_loaded, on_error=None, on_cancel=None):
+        """Получение таблицы без блокировки окна: из кэша сразу, иначе в фоновом потоке"""
+        fingerprint = file_fingerprint(filename)
+        table = self.lookup(filename, fingerprint)
+        if table is not None:
+            on_loaded(table)
+            return None
+
+        loader = TableLoader(self, parent, filename, fingerprint, on_loaded, on_error, on_cancel)
+        return loader.task.start()
+
+    def put(self, filename, table, fingerprint=None):
+        """Помещение таблицы в кэш (например, после сохранения файла)"""
+        if fingerprint is None:
+            fingerprint = file_fingerprint(filename)
+
+        self.invalidate(filename)
+
+        table.modified = False
+        table.fingerprint = fingerprint
+        # После записи файла смещения строк в старом файле недействительны
+        table.offsets = None
+        entry = CacheEntry(table, fingerprint, table.memory_usage())
+        self.entries[self.make_key(filename)] = entry
+        self.used_memory += entry.size
+        self.evict()
+
+    def touch(self, filename, table, fingerprint):
+        """Обновление отпечатка файла, измененного на месте (таблица уже содержит изменения)"""
+        table.fingerprint = fingerprint
+        entry = self.entries.get(self.make_key(filename))
+        if entry is not None and entry.table is table:
+            entry.fingerprint = fingerprint
+
+    def invalidate(self, filename):
+        """Удаление файла из кэша"""
+        entry = self.entries.pop(self.make_key(filename), None)
+        if entry is not None:
+            self.used_memory -= entry.size
+
+    def evict(self):
+        """Вытеснение давно не использованных таблиц сверх лимита памяти"""
+        while self.used_memory > self.memory_budget and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.used_memory -= entry.size
+
+    def clear(self):
+        """Очистка кэша"""
+        self.entries.clear()
+        self.used_memory = 0
+
+
+class TableLoader:
+    """Фоновая загрузка CSV файла: поток читает порции строк, окно добавляет их в таблицу"""
+
+    def __init__(self, cache, parent, filename, fingerprint, on_loaded, on_error, on_cancel):
+        self.cache = cache
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.on_loaded = on_loaded
+        self.table = None
+        # Смещения начала каждой строки данных в файле (байт)
+        self.offsets = array('Q')
+
+        self.task = BackgroundTask(
+            parent,
+            f"Загрузка файла {os.path.basename(filename)}",
+            self.read,
+            self.finish,
+            on_error=on_error,
+            on_chunk=self.add_rows,
+            on_cancel=on_cancel
+        )
+
+    def read(self, task):
+        """Чтение файла в рабочем потоке"""
+        total = os.path.getsize(self.filename)
+        # Количество байт, прочитанных из файла (начало следующей непрочитанной строки)
+        position = 0
+
+        def lines(file):
+            nonlocal position
+            for line in file:
+                position += len(line)
+                yield line.decode('utf-8')
+
+        with open(self.filename, 'rb') as file:
+            # csv.reader не читает строки наперед, поэтому позиция перед чтением записи - ее смещение
+            reader = csv.reader(lines(file))
+            task.send(next(reader, []))
+
+            chunk = []
+            offsets = array('Q')
+            while True:
+                offset = position
+                row = next(reader, None)
+                if row is None:
+                    break
+                if not row:
+                    continue
+                chunk.append(row)
+                offsets.append(offset)
+                if len(chunk) >= CHUNK_ROWS:
+                    task.send((chunk, offsets))
+                    task.report(position, total)
+                    chunk = []
+                    offsets = array('Q')
+
+            if chunk:
+                task.send((chunk, offsets))
+
+        task.report(total, total)
+
+    def add_rows(self, chunk):
+        """Добавление порции строк в таблицу (первая порция - заголовки)"""
+        if self.table is None:
+            self.table = DataTable(chunk)
+        else:
+            rows, offsets = chunk
+            self.table.extend(rows)
+            self.offsets.extend(offsets)
+
+    def finish(self, _):
+        """Помещение загруженной таблицы в кэш и передача ее окну"""
+        self.cache.put(self.filename, self.table, self.fingerprint)
+        self.table.offsets = self.offsets
+        self.on_loaded(self.table)
@@ -0,0 +1,353 @@
+"""
+Модуль журнала изменений таблицы (файл-спутник рядом с CSV файлом)
+"""
+
+import csv
+import json
+import os
+from array import array
+from bisect import bisect_left
+from operator import gt
+
+from atomic_writer import atomic_open
+from background_task import BackgroundTask
+from dataset_cache import JOURNALED_TABLES, DatasetCache, OffsetWriter, file_fingerprint, spread_offsets
+
+# Расширение файла журнала
+JOURNAL_SUFFIX = ".journal"
+
+# Доля удаленных строк файла, после которой файл перезаписывается без них
+COMPACT_RATIO = 0.25
+
+# Через сколько строк сообщать о прогрессе записи и проверять отмену
+REPORT_ROWS = 10000
+
+# Отметка строки таблицы, которой нет в файле
+NO_POSITION = 0xFFFFFFFF
+
+
+class FileChangedError(Exception):
+    """Файл изменен не через журнал (например, массовой операцией в другом окне)"""
+
+    def __init__(self):
+        super().__init__("Файл изменен в другом окне после загрузки данных. "
+                         "Загрузите данные заново, чтобы не потерять эти изменения")
+
+
+class EditJournal:
+    """Журнал изменений: каждое изменение сразу дописывается в файл журнала, а сохранение
+    (контрольная точка) переносит накопленные изменения в CSV файл
+
+    Записи журнала ссылаются на строки по их номерам в CSV файле, поэтому журнал можно
+    применить к заново загруженному файлу после сбоя. Файлом журнала владеет один журнал
+    на весь процесс - журнал таблицы, зарегистрированной для файла в JOURNALED_TABLES
+    """
+
+    def __init__(self, filename, table):
+        self.filename = filename
+        self.path = filename + JOURNAL_SUFFIX
+        self.key = DatasetCache.make_key(filename)
+        self.table = table
+        self.file = None
+        # Признак выполняющейся записи файла
+        self.running = False
+        # Порядковый номер последней записи журнала (не сбрасывается при очистке журнала)
+        self.sequence = 0
+        self.attach()
+
+    @classmethod
+    def for_table(cls, table, filename):
+        """Общий для всех окон журнал таблицы
+
+        Другая таблица для того же файла появляется, только если файл изменен после ее загрузки:
+        ее журнал перестает владеть файлом журнала и больше не пишет в него
+        """
+        key = DatasetCache.make_key(filename)
+        previous = JOURNALED_TABLES.get(key)
+        if previous is not None and previous is not table:
+            previous_journal = cls.of(previous, filename)
+            if previous_journal is not None:
+                previous_journal.close()
+        JOURNALED_TABLES[key] = table
+
+        journal = table.get_index(('journal', os.path.abspath(filename)), lambda table: cls(filename, table))
+        if not table.modified:
+            # Таблица соответствует файлу: прежние изменения уже записаны в него другим окном,
+            # а номера строк файла берутся из таблицы
+            if journal.entries:
+                journal.discard()
+            journal.attach()
+        return journal
+
+    @classmethod
+    def of(cls, table, filename):
+        """Журнал таблицы, если он уже создан (иначе None)"""
+        return table.indexes.get(('journal', os.path.abspath(filename)))
+
+    def owns_file(self):
+        """Проверка, что файл журнала принадлежит этому журналу"""
+        return JOURNALED_TABLES.get(self.key) is self.table
+
+    def attach(self, fingerprint=None, rows=None, size=None):
+        """Привязка журнала к содержимому файла: строки файла - строки таблицы rows
+        (по умолчанию неудаленные строки по порядку)"""
+        self.close()
+        self.fingerprint = list(fingerprint or file_fingerprint(self.filename))
+        self.rows = rows if rows is not None else self.table.row_ids()
+        self.size = size if size is not None else self.table.size
+        # Номера строк файла по id строк, если строки записаны не по порядку id (сохраненная сортировка)
+        self.numbers = None
+        if not isinstance(self.rows, range) and any(map(gt, self.rows, self.rows[1:])):
+            self.numbers = array('I', [NO_POSITION]) * self.size
+            for position, row_id in enumerate(self.rows):
+                self.numbers[row_id] = position
+        # Изменения после контрольной точки (с id строк таблицы) и признак начатого файла журнала
+        self.entries = []
+        self.started = False
+        # Количество строк файла, удаленных после контрольной точки
+        self.deleted = 0
+
+    def position(self, row_id):
+        """Номер строки в файле для id строки таблицы"""
+        if row_id >= self.size:
+            # Строка добавлена после контрольной точки
+            return len(self.rows) + row_id - self.size
+        if isinstance(self.rows, range):
+            return row_id
+        if self.numbers is not None:
+            position = self.numbers[row_id]
+            return position if position != NO_POSITION else None
+        position = bisect_left(self.rows, row_id)
+        if position < len(self.rows) and self.rows[position] == row_id:
+            return position
+        return None
+
+    def row_id(self, position):
+        """Id строки таблицы для номера строки в файле"""
+        if position < len(self.rows):
+            return self.rows[position]
+        return self.size + position - len(self.rows)
+
+    def to_file(self, entry):
+        """Запись журнала с номерами строк файла вместо id строк"""
+        entry = dict(entry)
+        del entry["seq"]
+        if "row" in entry:
+            entry["row"] = self.position(entry["row"])
+        if "rows" in entry:
+            entry["rows"] = [position for position in map(self.position, entry["rows"]) if position is not None]
+        return entry
+
+    def header_line(self):
+        """Первая строка файла журнала: отпечаток файла данных и его заголовки"""
+        header = {"fingerprint": self.fingerprint, "headers": self.table.headers}
+        return json.dumps(header, ensure_ascii=False) + "\n"
+
+    def remember(self, entry):
+        """Добавление записи в список изменений с очередным порядковым номером"""
+        self.sequence += 1
+        entry["seq"] = self.sequence
+        self.entries.append(entry)
+
+    def record(self, entry):
+        """Добавление записи в журнал со сбросом на диск"""
+        self.remember(entry)
+        if not self.owns_file():
+            # Таблица устарела: изменения остаются только в памяти, сохранить их уже нельзя
+            return
+
+        if self.file is None:
+            self.file = open(self.path, 'a' if self.started else 'w', encoding='utf-8')
+            if not self.started:
+                self.file.write(self.header_line())
+                self.started = True
+
+        self.file.write(json.dumps(self.to_file(entry), ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def log_update(self, row_id, values):
+        """Запись изменения строки"""
+        self.record({"op": "update", "row": row_id, "values": dict(values)})
+
+    def log_delete(self, row_ids):
+        """Запись удаления строк"""
+        row_ids = list(row_ids)
+        self.deleted += len(row_ids)
+        self.record({"op": "delete", "rows": row_ids})
+
+    def log_clear(self):
+        """Запись удаления всех строк"""
+        self.deleted = len(self.rows)
+        self.record({"op": "clear"})
+
+    def needs_compaction(self):
+        """Проверка, что удаленных строк в файле стало достаточно много для его перезаписи"""
+        return not self.running and self.deleted > COMPACT_RATIO * len(self.rows)
+
+    def patched(self, row_id, fingerprint):
+        """Учет строки, измененной прямо в файле: ее прежние изменения из журнала больше не нужны,
+        а журнал привязывается к новому отпечатку файла (номера строк файла не меняются)"""
+        self.entries = [entry for entry in self.entries
+                        if not (entry["op"] == "update" and entry["row"] == row_id)]
+        self.rebind(fingerprint)
+
+    def rebind(self, fingerprint):
+        """Привязка журнала к новому отпечатку файла, изменение которого не сдвинуло номера его строк
+        (строка изменена на месте или строки дописаны в конец файла)"""
+        self.fingerprint = list(fingerprint)
+        if not self.started or not self.owns_file():
+            return
+
+        self.close()
+        with atomic_open(self.path) as file:
+            file.write(self.header_line())
+            for entry in self.entries:
+                file.write(json.dumps(self.to_file(entry), ensure_ascii=False) + "\n")
+
+    def saved(self, rows):
+        """Учет файла, перезаписанного строками таблицы rows (в порядке файла) другим окном:
+        изменения из журнала уже в файле, журнал начинается заново"""
+        self.discard()
+        self.attach(rows=rows, size=self.table.size)
+
+    def check_file(self, fingerprint=None):
+        """Проверка, что файл на диске - тот, к которому привязан журнал"""
+        if not self.owns_file() or list(file_fingerprint(self.filename)) != (fingerprint or self.fingerprint):
+            raise FileChangedError()
+
+    def pending(self):
+        """Записи журнала, оставшегося от прошлой работы с файлом (пустой список, если журнал не подходит)"""
+        # Файл, начатый этим журналом, содержит его собственные изменения, а не изменения прошлой работы
+        if self.entries or self.started or not self.owns_file() or not os.path.exists(self.path):
+            return []
+
+        entries = []
+        with open(self.path, 'r', encoding='utf-8') as file:
+            try:
+                header = json.loads(file.readline())
+            except ValueError:
+                return []
+            if header.get("fingerprint") != self.fingerprint or header.get("headers") != self.table.headers:
+                # Журнал относится к другой версии файла
+                return []
+
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # Последняя запись могла быть записана не полностью
+                    break
+        return entries
+
+    def replay(self, entries):
+        """Применение записей журнала к таблице, загруженной из файла"""
+        table = self.table
+        for entry in entries:
+            op = entry.get("op")
+            if op == "update":
+                row_id = self.row_id(entry["row"])
+                if table.is_live(row_id):
+                    table.update(row_id, entry["values"])
+                    self.remember({"op": "update", "row": row_id, "values": entry["values"]})
+            elif op == "delete":
+                row_ids = [self.row_id(position) for position in entry["rows"]]
+                row_ids = [row_id for row_id in row_ids if table.is_live(row_id)]
+                table.delete(row_ids)
+                self.deleted += len(row_ids)
+                self.remember({"op": "delete", "rows": row_ids})
+            elif op == "clear":
+                # Строки помечаются удаленными, чтобы не менять id строк для следующих записей
+                table.delete(table.row_ids())
+                self.deleted = len(self.rows)
+                self.remember({"op": "clear"})
+
+        # Новые записи дописываются в тот же файл журнала
+        self.started = True
+        return len(entries)
+
+    def close(self):
+        """Закрытие файла журнала"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def discard(self):
+        """Удаление журнала (файл журнала удаляется, только если принадлежит этому журналу)"""
+        self.close()
+        if self.owns_file() and os.path.exists(self.path):
+            os.remove(self.path)
+        self.entries = []
+        self.started = False
+        self.deleted = 0
+
+    def checkpoint(self, parent, datasets, fieldnames, on_done, on_error=None, on_cancel=None):
+        """Фоновая запись таблицы в файл и очистка журнала
+
+        Записывается снимок таблицы на момент вызова; изменения, сделанные во время записи,
+        переносятся в новый журнал. Если файл изменен не через журнал, запись отменяется
+        (FileChangedError), чтобы не вернуть в файл строки, которых в нем уже нет
+        """
+        self.check_file()
+        expected = self.fingerprint
+        table = self.table
+        headers = list(fieldnames)
+        # Снимок: коды значений копируются, словари значений только пополняются
+        columns = [(table.columns[header].values, table.columns[header].codes[:])
+                   if header in table.columns else None for header in headers]
+        rows = table.row_ids()
+        size = table.size
+        # Записи журнала с большими номерами сделаны после снимка
+        mark = self.sequence
+
+        def work(task):
+            total = len(rows)
+            self.check_file(expected)
+            with atomic_open(self.filename) as file:
+                recorder = OffsetWriter(file)
+                writer = csv.writer(recorder)
+                writer.writerow(headers)
+                for done, row_id in enumerate(rows, 1):
+                    writer.writerow([column[0][column[1][row_id]] if column is not None else ''
+                                     for column in columns])
+                    if done % REPORT_ROWS == 0:
+                        task.report(done, total, f"Сохранение: {done} из {total} записей")
+            offsets = spread_offsets(size, rows, recorder.offsets[1:], recorder.position)
+            return file_fingerprint(self.filename), offsets
+
+        def finish(result):
+            fingerprint, offsets = result
+            self.running = False
+            later = [entry for entry in self.entries if entry["seq"] > mark]
+            datasets.put(self.filename, table, fingerprint)
+            if table.size == size:
+                # Смещения строк в записанном файле (для изменения строк на месте)
+                table.offsets = offsets
+
+            # Файл теперь содержит снимок таблицы - журнал начинается заново
+            self.discard()
+            self.attach(fingerprint, rows, size)
+            for entry in later:
+                del entry["seq"]
+                if entry["op"] == "delete":
+                    self.deleted += len(entry["rows"])
+                self.record(entry)
+            table.modified = bool(later)
+            on_done(len(rows))
+
+        def stopped(callback):
+            def handler(*args):
+                self.running = False
+                if callback is not None:
+                    callback(*args)
+            return handler
+
+        self.running = True
+        return BackgroundTask(
+            parent,
+            f"Сохранение файла {os.path.basename(self.filename)}",
+            work,
+            finish,
+            on_error=stopped(on_error),
+            on_cancel=stopped(on_cancel)
+        ).start()
@@ -0,0 +1,162 @@
+"""
+Модуль внешней сортировки CSV файлов, не помещающихся в памяти
+"""
+
+import csv
+import heapq
+import os
+import tempfile
+from contextlib import ExitStack
+from functools import lru_cache
+
+from atomic_writer import atomic_open
+from sort_keys import DescendingKey, sort_key
+
+# Лимит памяти на одну порцию строк по умолчанию (байт)
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Максимальное количество порций, сливаемых за один проход
+MERGE_FAN_IN = 64
+
+# Приблизительные накладные расходы памяти на строку и на значение (байт)
+ROW_OVERHEAD = 120
+VALUE_OVERHEAD = 50
+
+# Через сколько строк сообщать о прогрессе и проверять отмену
+REPORT_ROWS = 10000
+
+
+class ExternalSorter:
+    """Сортировка CSV файла порциями: порции сортируются в памяти, сбрасываются во временные
+    файлы и сливаются в итоговый файл"""
+
+    def __init__(self, source, target, spec, memory_budget=DEFAULT_MEMORY_BUDGET, encoding='utf-8'):
+        self.source = source
+        self.target = target
+        # Уровни сортировки: пары (поле, по убыванию)
+        self.spec = list(spec)
+        self.memory_budget = memory_budget
+        self.encoding = encoding
+        self.headers = []
+
+    def make_row_key(self):
+        """Функция ключа строки с теми же ключами, что и при сортировке в памяти"""
+        cached_key = lru_cache(maxsize=65536)(sort_key)
+        positions = []
+        for field, reverse in self.spec:
+            if field not in self.headers:
+                raise ValueError(f"В файле нет поля '{field}'")
+            positions.append((self.headers.index(field), field, reverse))
+
+        def row_key(row):
+            return tuple(DescendingKey(cached_key(field, row[position])) if reverse
+                         else cached_key(field, row[position])
+                         for position, field, reverse in positions)
+
+        return row_key
+
+    def run(self, task=None):
+        """Сортировка файла, возвращает количество записанных строк"""
+        with ExitStack() as stack:
+            runs, count = self.split_runs(task, stack)
+            row_key = self.make_row_key()
+
+            # Если порций слишком много, сливаем их в несколько проходов
+            while len(runs) > MERGE_FAN_IN:
+                merged = []
+                for start in range(0, len(runs), MERGE_FAN_IN):
+                    group = runs[start:start + MERGE_FAN_IN]
+                    merged.append(self.write_run(self.merge(group, row_key), stack))
+                    for run in group:
+                        run.close()
+                runs = merged
+
+            self.write_output(self.merge(runs, row_key), count, task)
+        return count
+
+    def split_runs(self, task, stack):
+        """Чтение исходного файла порциями в пределах лимита памяти и запись отсортированных порций"""
+        total = os.path.getsize(self.source)
+        # Отсортированные порции по уровням слияния
+        levels = []
+        count = 0
+
+        with open(self.source, 'r', encoding=self.encoding, newline='') as file:
+            reader = csv.reader(file)
+            self.headers = next(reader, [])
+            row_key = self.make_row_key()
+            width = len(self.headers)
+
+            rows = []
+            used = 0
+            for row in reader:
+                # Строки приводятся к числу заголовков так же, как при загрузке в таблицу
+                if not row:
+                    continue
+                if len(row) < width:
+                    row = row + [''] * (width - len(row))
+                elif len(row) > width:
+                    row = row[:width]
+
+                rows.append(row)
+                used += ROW_OVERHEAD + sum(len(value) + VALUE_OVERHEAD for value in row)
+                count += 1
+
+                if used >= self.memory_budget:
+                    self.add_run(levels, self.sort_run(rows, row_key, stack), row_key, stack)
+                    rows = []
+                    used = 0
+
+                if task is not None and count % REPORT_ROWS == 0:
+                    task.report(file.buffer.tell(), total, f"Сортировка порций: {count} строк")
+
+            if rows:
+                self.add_run(levels, self.sort_run(rows, row_key, stack), row_key, stack)
+
+        # Порции более высоких уровней содержат более ранние строки файла
+        runs = [run for level in reversed(levels) for run in level]
+        return runs, count
+
+    def add_run(self, levels, run, row_key, stack):
+        """Добавление порции: как только на уровне набирается MERGE_FAN_IN порций, они сливаются
+        в одну порцию следующего уровня, поэтому открытых временных файлов остается немного"""
+        level = 0
+        while True:
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(run)
+            if len(levels[level]) < MERGE_FAN_IN:
+                return
+
+            group = levels[level]
+            levels[level] = []
+            run = self.write_run(self.merge(group, row_key), stack)
+            for merged in group:
+                merged.close()
+            level += 1
+
+    def sort_run(self, rows, row_key, stack):
+        """Сортировка порции в памяти и запись ее во временный файл"""
+        rows.sort(key=row_key)
+        return self.write_run(rows, stack)
+
+    def write_run(self, rows, stack):
+        """Запись строк во временный файл, возвращает файл, открытый для чтения с начала"""
+        run = stack.enter_context(tempfile.TemporaryFile('w+', encoding=self.encoding, newline=''))
+        csv.writer(run).writerows(rows)
+        run.seek(0)
+        return run
+
+    def merge(self, runs, row_key):
+        """Слияние отсортированных порций (при равных ключах сохраняется исходный порядок строк)"""
+        return heapq.merge(*(csv.reader(run) for run in runs), key=row_key)
+
+    def write_output(self, rows, count, task):
+        """Запись результата с атомарной заменой целевого файла"""
+        with atomic_open(self.target, encoding=self.encoding) as file:
+            writer = csv.writer(file)
+            writer.writerow(self.headers)
+            for written, row in enumerate(rows, 1):
+                writer.writerow(row)
+                if task is not None and written % REPORT_ROWS == 0:
+                    task.report(written, count, f"Слияние порций: {written} из {count} строк")
@@ -7,6 +7,10 @@ from tkinter import ttk, messagebox, filedialog
 import csv
 import os
 
+from atomic_writer import atomic_open
+from data_table import DataTable
+from id_index import IdIndex
+
 
 class FileCreator:
     """Класс для создания CSV файла с данными о браузерах"""
@@ -15,7 +19,6 @@ class FileCreator:
         self.parent = parent
         self.window = None
         self.entries = {}
-        self.data = []
 
         # Определяем поля для таблицы браузеров
         self.fields = {
@@ -27,6 +30,9 @@ class FileCreator:
             'engine': 'Движок'
         }
 
+        # Записи создаваемого файла (элементы списка имеют id строк таблицы)
+        self.data = DataTable(self.fields.keys())
+
     def show(self):
         """Показать окно создания файла"""
         if self.window is not None:
@@ -169,18 +175,17 @@ class FileCreator:
 
         # Проверяем уникальность ID
         browser_id = record['browser_id']
-        for existing_record in self.data:
-            if existing_record['browser_id'] == browser_id:
-                messagebox.showwarning(
-                    "Предупреждение",
-                    f"Браузер с ID '{browser_id}' уже существует!"
-                )
-                self.entries['browser_id'].focus()
-                return
+        if IdIndex.for_table(self.data).find(browser_id) is not None:
+            messagebox.showwarning(
+                "Предупреждение",
+                f"Браузер с ID '{browser_id}' уже существует!"
+            )
+            self.entries['browser_id'].focus()
+            return
 
         # Добавляем запись в данные и в список
-        self.data.append(record)
-        self.tree.insert('', tk.END, values=list(record.values()))
+        row_id = self.data.append(record)
+        self.tree.insert('', tk.END, iid=str(row_id), values=list(record.values()))
 
         self.clear_fields()
         messagebox.showinfo("Успех", "Запись успешно добавлена!")
@@ -198,11 +203,8 @@ class FileCreator:
             return
 
         if messagebox.askyesno("Подтверждение", "Удалить выбранную запись?"):
-            # Получаем индекс записи
-            item_index = self.tree.index(selected_item[0])
-
-            # Удаляем из данных и из списка
-            del self.data[item_index]
+            # Удаляем из данных (по id строки) и из списка
+            self.data.delete([int(selected_item[0])])
             self.tree.delete(selected_item[0])
 
             messagebox.showinfo("Успех", "Запись удалена!")
@@ -275,8 +277,8 @@ class FileCreator:
             ]
 
             for record in sample_data:
-                self.data.append(record)
-                self.tree.insert('', tk.END, values=list(record.values()))
+                row_id = self.data.append(record)
+                self.tree.insert('', tk.END, iid=str(row_id), values=list(record.values()))
 
             messagebox.showinfo("Успех", "Образец данных загружен!")
 
@@ -295,7 +297,7 @@ class FileCreator:
 
         if filename:
             try:
-                with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+                with atomic_open(filename) as csvfile:
                     fieldnames = list(self.fields.keys())
                     writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
@@ -4,16 +4,20 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import csv
 import os
 from datetime import datetime
 
+from dataset_cache import DatasetCache
+from virtual_table import VirtualTable
+
 
 class FilePrinter:
     """Класс для печати/просмотра CSV файла с данными о браузерах"""
 
-    def __init__(self, parent):
+    def __init__(self, parent, datasets=None):
         self.parent = parent
+        # Общий кэш загруженных наборов данных
+        self.datasets = datasets if datasets is not None else DatasetCache()
         self.window = None
         self.data = []
         self.current_file = None
@@ -107,11 +111,10 @@ class FilePrinter:
         data_frame.columnconfigure(0, weight=1)
         data_frame.rowconfigure(0, weight=1)
 
-        # Создаем Treeview для отображения данных
-        self.tree = ttk.Treeview(
+        # Создаем виртуальную таблицу для отображения данных
+        self.tree = VirtualTable(
             data_frame,
             columns=list(self.fields.keys()),
-            show="headings",
             height=15
         )
 
@@ -132,17 +135,7 @@ class FilePrinter:
             elif field_name == 'engine':
                 self.tree.column(field_name, width=100, minwidth=80)
 
-        # Скроллбары для таблицы
-        v_scrollbar = ttk.Scrollbar(data_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        h_scrollbar = ttk.Scrollbar(data_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
-        self.tree.configure(
-            yscrollcommand=v_scrollbar.set,
-            xscrollcommand=h_scrollbar.set
-        )
-
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
 
         # Информационная панель
         info_frame = ttk.Frame(main_frame)
@@ -179,41 +172,34 @@ class FilePrinter:
             self.load_file(filename)
 
     def load_file(self, filename):
-        """Загрузить данные из файла"""
+        """Загрузить данные из файла (чтение выполняется в фоновом потоке)"""
+        try:
+            self.datasets.load(
+                self.window,
+                filename,
+                lambda table: self.show_table(filename, table),
+                on_error=self.show_load_error
+            )
+        except Exception as e:
+            self.show_load_error(e)
+
+    def show_table(self, filename, table):
+        """Отобразить загруженную таблицу"""
         try:
-            self.data.clear()
-
-            # Очищаем таблицу
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-
-            # Читаем CSV файл
-            with open(filename, 'r', encoding='utf-8') as csvfile:
-                # Пытаемся автоматически определить разделитель
-                sample = csvfile.read(1024)
-                csvfile.seek(0)
-
-                # Создаем reader
-                reader = csv.DictReader(csvfile)
-
-                # Читаем данные
-                for row_num, row in enumerate(reader, 1):
-                    # Проверяем наличие необходимых полей
-                    if not all(field in row for field in self.fields.keys()):
-                        missing_fields = [field for field in self.fields.keys() if field not in row]
-                        messagebox.showerror(
-                            "Ошибка",
-                            f"В файле отсутствуют обязательные поля:\n{', '.join(missing_fields)}\n\n"
-                            f"Ожидаемые поля: {', '.join(self.fields.keys())}"
-                        )
-                        return
-
-                    # Добавляем запись в данные
-                    record = {field: row.get(field, '').strip() for field in self.fields.keys()}
-                    self.data.append(record)
-
-                    # Добавляем в таблицу
-                    self.tree.insert('', tk.END, values=list(record.values()))
+            # Проверяем наличие необходимых полей
+            missing_fields = [field for field in self.fields.keys() if field not in table.headers]
+            if missing_fields:
+                messagebox.showerror(
+                    "Ошибка",
+                    f"В файле отсутствуют обязательные поля:\n{', '.join(missing_fields)}\n\n"
+                    f"Ожидаемые поля: {', '.join(self.fields.keys())}"
+                )
+                return
+
+            self.data = table
+
+            # Отображаем записи (элементы создаются только для видимых строк)
+            self.tree.set_rows(self.data, self.data.row_ids())
 
             # Обновляем информацию о файле
             self.current_file = filename
@@ -231,15 +217,20 @@ class FilePrinter:
                 f"Записей: {len(self.data)}"
             )
 
-        except UnicodeDecodeError:
+        except Exception as e:
+            self.show_load_error(e)
+
+    def show_load_error(self, error):
+        """Показать ошибку загрузки файла"""
+        if isinstance(error, UnicodeDecodeError):
             messagebox.showerror(
                 "Ошибка",
                 "Ошибка кодировки файла. Попробуйте сохранить файл в UTF-8."
             )
-        except Exception as e:
+        else:
             messagebox.showerror(
                 "Ошибка",
-                f"Ошибка при загрузке файла:\n{str(e)}"
+                f"Ошибка при загрузке файла:\n{str(error)}"
             )
 
     def refresh_data(self):
@@ -450,7 +441,7 @@ class FilePrinter:
         """Обработчик двойного клика по записи"""
         selected_item = self.tree.selection()
         if selected_item:
-            item_values = self.tree.item(selected_item[0])['values']
+            item_values = self.tree.row_values(selected_item[0])
 
             # Создаем окно с подробной информацией
             detail_window = tk.Toplevel(self.window)
@@ -508,7 +499,7 @@ class FilePrinter:
         """Копировать выбранную строку в буфер обмена"""
         selected_item = self.tree.selection()
         if selected_item:
-            item_values = self.tree.item(selected_item[0])['values']
+            item_values = self.tree.row_values(selected_item[0])
 
             # Формируем строку для копирования
             row_text = []
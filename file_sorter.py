@@ -5,19 +5,42 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import csv
+import heapq
 import os
-from datetime import datetime
+
+from atomic_writer import atomic_open
+from background_task import BackgroundTask
+from dataset_cache import DatasetCache, file_fingerprint
+from edit_journal import EditJournal, FileChangedError
+from external_sort import DEFAULT_MEMORY_BUDGET, ExternalSorter
+from parallel_sort import parallel_sort
+from sort_index import load_sort_index, offsets_to_rows, save_sort_index
+from sort_keys import SortKeyIndex, composite_keys, reverse_sorted, sort_key
+from virtual_table import VirtualTable
+
+# Количество строк, начиная с которого сортировка выполняется в фоновом потоке с окном прогресса
+BACKGROUND_SORT_ROWS = 200000
 
 
 class FileSorter:
     """Класс для упорядочения записей в файле"""
 
-    def __init__(self, parent):
+    def __init__(self, parent, datasets=None):
         self.parent = parent
+        # Общий кэш загруженных наборов данных
+        self.datasets = datasets if datasets is not None else DatasetCache()
         self.window = None
         self.filename = ""
         self.records = []
-        self.original_records = []
+        # Текущий порядок строк (id строк таблицы) и последняя сортировка (поле, направление, версия данных)
+        self.order = []
+        self.last_sort = None
+        # Поля и направление, по которым упорядочен текущий порядок (None - исходный порядок)
+        self.sort_spec = None
+        # Признак того, что показаны только первые N записей, а не весь файл
+        self.partial = False
+        # Выполняющаяся фоновая сортировка
+        self.sort_task = None
         self.headers = ["browser_id", "browser_name", "developer", "release_date", "latest_version", "engine"]
 
     def show(self):
@@ -67,47 +90,28 @@ class FileSorter:
         ttk.Button(control_frame, text="Сохранить изменения", command=self.save_data).grid(row=0, column=2,
                                                                                            padx=(0, 10))
 
+        # Внешняя сортировка файла без загрузки в память
+        ttk.Button(control_frame, text="Сортировать файл без загрузки", command=self.external_sort).grid(row=0,
+                                                                                                       column=3,
+                                                                                                       padx=(0, 10))
+        ttk.Label(control_frame, text="Лимит памяти (МБ):").grid(row=0, column=4, padx=(0, 5))
+        self.memory_budget_var = tk.StringVar(value=str(DEFAULT_MEMORY_BUDGET // (1024 * 1024)))
+        ttk.Spinbox(control_frame, from_=16, to=65536, increment=16, width=8,
+                    textvariable=self.memory_budget_var).grid(row=0, column=5)
+
         # Фрейм для сортировки
         sort_frame = ttk.LabelFrame(main_frame, text="Параметры сортировки", padding="10")
         sort_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
 
-        # Первый уровень сортировки
-        ttk.Label(sort_frame, text="Основное поле для сортировки:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
-        self.sort_field1 = ttk.Combobox(sort_frame, width=20, state="readonly")
-        self.sort_field1['values'] = [
-            "browser_id - ID браузера",
-            "browser_name - Название браузера",
-            "developer - Разработчик",
-            "release_date - Дата выпуска",
-            "latest_version - Последняя версия",
-            "engine - Движок"
-        ]
-        self.sort_field1.grid(row=0, column=1, padx=(0, 10))
-        self.sort_field1.set("browser_name - Название браузера")
-
-        self.sort_order1 = tk.StringVar(value="asc")
-        ttk.Radiobutton(sort_frame, text="По возрастанию", variable=self.sort_order1, value="asc").grid(row=0, column=2,
-                                                                                                        padx=(0, 10))
-        ttk.Radiobutton(sort_frame, text="По убыванию", variable=self.sort_order1, value="desc").grid(row=0, column=3)
-
-        # Второй уровень сортировки
-        ttk.Label(sort_frame, text="Дополнительное поле:").grid(row=1, column=0, sticky=tk.W, padx=(0, 10),
-                                                                pady=(10, 0))
-        self.sort_field2 = ttk.Combobox(sort_frame, width=20, state="readonly")
-        self.sort_field2['values'] = ["Не использовать"] + list(self.sort_field1['values'])
-        self.sort_field2.grid(row=1, column=1, padx=(0, 10), pady=(10, 0))
-        self.sort_field2.set("Не использовать")
-
-        self.sort_order2 = tk.StringVar(value="asc")
-        ttk.Radiobutton(sort_frame, text="По возрастанию", variable=self.sort_order2, value="asc").grid(row=1, column=2,
-                                                                                                        padx=(0, 10),
-                                                                                                        pady=(10, 0))
-        ttk.Radiobutton(sort_frame, text="По убыванию", variable=self.sort_order2, value="desc").grid(row=1, column=3,
-                                                                                                      pady=(10, 0))
+        # Уровни сортировки: каждый со своим полем и направлением
+        self.levels_frame = ttk.Frame(sort_frame)
+        self.levels_frame.grid(row=0, column=0, columnspan=4, sticky=(tk.W, tk.E))
+        self.sort_levels = []
+        self.add_sort_level("browser_name")
 
         # Кнопки сортировки
         button_frame = ttk.Frame(sort_frame)
-        button_frame.grid(row=2, column=0, columnspan=4, pady=(15, 0))
+        button_frame.grid(row=1, column=0, columnspan=4, pady=(15, 0))
 
         ttk.Button(button_frame, text="Применить сортировку", command=self.apply_sort).grid(row=0, column=0,
                                                                                             padx=(0, 10))
@@ -119,14 +123,35 @@ class FileSorter:
         ttk.Button(button_frame, text="Сортировка по разработчику", command=self.quick_sort_developer).grid(row=0,
                                                                                                             column=3)
 
+        # Сохраненный порядок сортировки без перезаписи файла
+        ttk.Button(button_frame, text="Сохранить индекс порядка", command=self.save_order_index).grid(row=1,
+                                                                                                    column=0,
+                                                                                                    padx=(0, 10),
+                                                                                                    pady=(10, 0))
+        ttk.Button(button_frame, text="Открыть в сохраненном порядке", command=self.open_order_index).grid(row=1,
+                                                                                                         column=1,
+                                                                                                         padx=(0, 10),
+                                                                                                         pady=(10, 0))
+        ttk.Button(button_frame, text="Добавить уровень сортировки",
+                   command=self.add_sort_level).grid(row=1, column=2, padx=(0, 10), pady=(10, 0))
+
+        # Частичная сортировка: только первые N записей
+        top_frame = ttk.Frame(button_frame)
+        top_frame.grid(row=2, column=0, columnspan=4, pady=(10, 0))
+        ttk.Label(top_frame, text="Первые N записей:").grid(row=0, column=0, padx=(0, 5))
+        self.top_n_var = tk.StringVar(value="100")
+        ttk.Spinbox(top_frame, from_=1, to=1000000, increment=10, width=10,
+                    textvariable=self.top_n_var).grid(row=0, column=1, padx=(0, 10))
+        ttk.Button(top_frame, text="Показать первые N", command=self.show_top_n).grid(row=0, column=2)
+
         # Таблица для отображения записей
         table_frame = ttk.LabelFrame(main_frame, text="Записи браузеров", padding="5")
         table_frame.grid(row=3, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         table_frame.columnconfigure(0, weight=1)
         table_frame.rowconfigure(0, weight=1)
 
-        # Создание Treeview
-        self.tree = ttk.Treeview(table_frame, columns=self.headers, show='headings', height=15)
+        # Создание виртуальной таблицы (элементы только для видимых строк)
+        self.tree = VirtualTable(table_frame, columns=self.headers, height=15)
 
         # Настройка заголовков с возможностью сортировки по клику
         column_widths = [80, 150, 150, 100, 120, 120]
@@ -135,15 +160,8 @@ class FileSorter:
             self.tree.heading(header, text=display_name, command=lambda h=header: self.sort_by_column(h))
             self.tree.column(header, width=column_widths[i], minwidth=50)
 
-        # Scrollbars
-        v_scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        h_scrollbar = ttk.Scrollbar(table_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
-        self.tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
-
-        # Размещение таблицы и scrollbars
+        # Размещение таблицы
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
 
         # Статусная строка
         self.status_var = tk.StringVar()
@@ -172,115 +190,287 @@ class FileSorter:
             return
 
         try:
-            self.records = []
-            self.original_records = []
+            self.datasets.load(self.window, self.filename, self.on_data_loaded, on_error=self.on_load_error,
+                               on_cancel=lambda: self.status_var.set("Загрузка отменена"))
+        except Exception as e:
+            self.on_load_error(e)
 
-            with open(self.filename, 'r', encoding='utf-8', newline='') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    self.records.append(row)
-                    self.original_records.append(row.copy())
+    def on_data_loaded(self, table):
+        """Обработка загруженных данных"""
+        self.records = table
+        self.order = list(self.records.row_ids())
+        self.sort_task = None
+        self.last_sort = None
+        self.sort_spec = None
+        self.partial = False
 
-            self.refresh_table()
-            self.status_var.set(f"Загружено {len(self.records)} записей")
+        self.refresh_table()
+        self.status_var.set(f"Загружено {len(self.records)} записей")
 
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка загрузки файла: {str(e)}")
+    def on_load_error(self, error):
+        """Обработка ошибки загрузки"""
+        messagebox.showerror("Ошибка", f"Ошибка загрузки файла: {str(error)}")
 
     def refresh_table(self):
         """Обновление таблицы"""
-        # Очистка таблицы
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # Заполнение таблицы
-        for i, record in enumerate(self.records):
-            values = [record.get(header, "") for header in self.headers]
-            self.tree.insert("", tk.END, iid=i, values=values)
+        # Отображение записей в текущем порядке (строки, удаленные в других окнах, пропускаются)
+        self.order = self.records.live_rows(self.order)
+        self.tree.set_rows(self.records, self.order)
 
     def get_sort_key(self, record, field):
         """Получение ключа для сортировки"""
-        value = record.get(field, "")
-
-        # Специальная обработка для даты
-        if field == "release_date":
-            try:
-                # Попытка преобразовать в дату
-                return datetime.strptime(value, "%Y")
-            except:
-                try:
-                    return datetime.strptime(value, "%Y-%m-%d")
-                except:
-                    return datetime.min
-
-        # Специальная обработка для версий
-        elif field == "latest_version":
-            try:
-                # Разбиваем версию на части и конвертируем в числа
-                parts = value.split('.')
-                return tuple(int(part) if part.isdigit() else 0 for part in parts)
-            except:
-                return (0,)
-
-        # Специальная обработка для ID
-        elif field == "browser_id":
-            try:
-                return int(value)
-            except:
-                return 0
-
-        # Для остальных полей - строковая сортировка
-        return value.lower()
+        return sort_key(field, record.get(field, ""))
+
+    def sort_rows(self, field, reverse, on_done):
+        """Устойчивая сортировка текущего порядка строк по кэшированным ключам колонки"""
+        keys = SortKeyIndex.for_table(self.records, field).row_keys()
+        version = self.records.version
+
+        def sorted_done():
+            self.last_sort = (field, reverse, version)
+            self.sort_spec = [(field, reverse)]
+            on_done()
+
+        # Повторная сортировка по тому же полю в обратном направлении - разворот текущего порядка
+        if self.last_sort == (field, not reverse, version):
+            self.order = reverse_sorted(self.order, keys)
+            sorted_done()
+        else:
+            self.sort_by_keys(keys, reverse, sorted_done)
 
-    def apply_sort(self):
-        """Применение сортировки"""
+    def sort_by_keys(self, keys, reverse, on_done):
+        """Устойчивая сортировка текущего порядка по ключам строк
+
+        Большие данные сортируются в фоновом потоке, а очень большие - еще и в нескольких процессах
+        """
+        # После показа первых N записей сортируются все строки, а не только показанные
+        order = list(self.records.row_ids()) if self.partial else list(self.order)
+
+        if len(order) < BACKGROUND_SORT_ROWS:
+            order.sort(key=keys.__getitem__, reverse=reverse)
+            self.order = order
+            self.partial = False
+            on_done()
+            return
+
+        def finish(result):
+            # Пока шла сортировка, порядок мог быть сброшен (загрузка данных, исходный порядок)
+            if self.sort_task is task:
+                self.sort_task = None
+                self.order = result
+                self.partial = False
+                on_done()
+
+        def stopped(*args):
+            if self.sort_task is task:
+                self.sort_task = None
+            if args:
+                messagebox.showerror("Ошибка", f"Ошибка сортировки: {str(args[0])}")
+            else:
+                self.status_var.set("Сортировка отменена")
+
+        # Ключи уже вычислены, поток только упорядочивает копию порядка строк
+        task = self.sort_task = BackgroundTask(
+            self.window,
+            f"Сортировка {len(order)} записей",
+            lambda background: parallel_sort(order, keys, reverse, background),
+            finish,
+            on_error=stopped,
+            on_cancel=stopped
+        ).start()
+
+    def can_sort(self):
+        """Проверка, что данные загружены и другая сортировка не выполняется"""
         if not self.records:
             messagebox.showwarning("Предупреждение", "Нет данных для сортировки")
+            return False
+        if self.sort_task is not None and not self.sort_task.finished_event.is_set():
+            messagebox.showwarning("Предупреждение", "Сортировка уже выполняется, дождитесь завершения")
+            return False
+        return True
+
+    def show_sorted(self, text):
+        """Отображение отсортированных данных"""
+        self.refresh_table()
+        self.status_var.set(text)
+
+    def apply_sort(self):
+        """Применение сортировки"""
+        if not self.can_sort():
             return
 
         try:
-            # Получаем поля для сортировки
-            field1_text = self.sort_field1.get()
-            field1 = field1_text.split(' - ')[0] if ' - ' in field1_text else field1_text
+            # Получаем уровни сортировки
+            spec = self.get_sort_spec()
+            sort_desc = ", ".join(f"'{field}' ({'desc' if reverse else 'asc'})" for field, reverse in spec)
 
-            field2_text = self.sort_field2.get()
-            field2 = None
-            if field2_text != "Не использовать":
-                field2 = field2_text.split(' - ')[0] if ' - ' in field2_text else field2_text
+            def on_done():
+                self.show_sorted(f"Данные отсортированы по {sort_desc}")
 
             # Применяем сортировку
-            if field2:
-                # Двухуровневая сортировка
-                self.records.sort(
-                    key=lambda x: (
-                        self.get_sort_key(x, field1),
-                        self.get_sort_key(x, field2)
-                    ),
-                    reverse=(self.sort_order1.get() == "desc")
-                )
+            if len(spec) > 1:
+                # Многоуровневая сортировка за один проход по составному ключу
+                keys = composite_keys([SortKeyIndex.for_table(self.records, field).row_keys() for field, _ in spec],
+                                      [reverse for _, reverse in spec])
+
+                def multi_done():
+                    self.last_sort = None
+                    self.sort_spec = spec
+                    on_done()
+
+                self.sort_by_keys(keys, False, multi_done)
             else:
                 # Одноуровневая сортировка
-                self.records.sort(
-                    key=lambda x: self.get_sort_key(x, field1),
-                    reverse=(self.sort_order1.get() == "desc")
-                )
+                self.sort_rows(spec[0][0], spec[0][1], on_done)
 
-            self.refresh_table()
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка сортировки: {str(e)}")
 
-            sort_desc = f"по полю '{field1}'"
-            if field2:
-                sort_desc += f" и '{field2}'"
-            sort_desc += f" ({self.sort_order1.get()})"
+    def show_top_n(self):
+        """Показ только первых N записей в порядке заданной сортировки (без сортировки всех строк)"""
+        if not self.records:
+            messagebox.showwarning("Предупреждение", "Нет данных для сортировки")
+            return
 
-            self.status_var.set(f"Данные отсортированы {sort_desc}")
+        try:
+            count = int(self.top_n_var.get())
+            if count <= 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Ошибка", "Количество записей должно быть целым положительным числом")
+            return
+
+        try:
+            spec = self.get_sort_spec()
+            rows = self.records.row_ids()
+
+            # Отбор кучей за один проход: в памяти хранятся только N лучших строк
+            if len(spec) == 1:
+                keys = SortKeyIndex.for_table(self.records, spec[0][0]).row_keys()
+                select = heapq.nlargest if spec[0][1] else heapq.nsmallest
+                self.order = select(count, rows, key=keys.__getitem__)
+            else:
+                keys = composite_keys([SortKeyIndex.for_table(self.records, field).row_keys() for field, _ in spec],
+                                      [reverse for _, reverse in spec])
+                self.order = heapq.nsmallest(count, rows, key=keys.__getitem__)
+
+            self.sort_task = None
+            self.last_sort = None
+            self.sort_spec = spec
+            self.partial = True
+            self.refresh_table()
+
+            sort_desc = ", ".join(f"'{field}' ({'desc' if reverse else 'asc'})" for field, reverse in spec)
+            self.status_var.set(f"Показаны первые {len(self.order)} из {len(self.records)} записей по {sort_desc}")
 
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка сортировки: {str(e)}")
 
+    def add_sort_level(self, field=None):
+        """Добавление уровня сортировки"""
+        field_names = {
+            "browser_id": "ID браузера",
+            "browser_name": "Название браузера",
+            "developer": "Разработчик",
+            "release_date": "Дата выпуска",
+            "latest_version": "Последняя версия",
+            "engine": "Движок"
+        }
+
+        level = {}
+        level['label'] = ttk.Label(self.levels_frame)
+        level['field'] = ttk.Combobox(self.levels_frame, width=20, state="readonly")
+        level['field']['values'] = [f"{name} - {label}" for name, label in field_names.items()]
+        if field is None:
+            # По умолчанию - первое поле, которое еще не используется
+            used = {name for name, _ in self.get_sort_spec()}
+            field = next((name for name in field_names if name not in used), "browser_id")
+        level['field'].set(f"{field} - {field_names[field]}")
+
+        level['order'] = tk.StringVar(value="asc")
+        level['asc'] = ttk.Radiobutton(self.levels_frame, text="По возрастанию", variable=level['order'], value="asc")
+        level['desc'] = ttk.Radiobutton(self.levels_frame, text="По убыванию", variable=level['order'], value="desc")
+        level['remove'] = ttk.Button(self.levels_frame, text="Удалить", command=lambda: self.remove_sort_level(level))
+
+        self.sort_levels.append(level)
+        self.layout_sort_levels()
+
+    def remove_sort_level(self, level):
+        """Удаление уровня сортировки"""
+        for name in ('label', 'field', 'asc', 'desc', 'remove'):
+            level[name].destroy()
+        self.sort_levels.remove(level)
+        self.layout_sort_levels()
+
+    def layout_sort_levels(self):
+        """Размещение уровней сортировки"""
+        for i, level in enumerate(self.sort_levels):
+            pady = (10, 0) if i else (0, 0)
+            text = "Основное поле для сортировки:" if i == 0 else f"Дополнительное поле {i}:"
+            level['label'].configure(text=text)
+            level['label'].grid(row=i, column=0, sticky=tk.W, padx=(0, 10), pady=pady)
+            level['field'].grid(row=i, column=1, padx=(0, 10), pady=pady)
+            level['asc'].grid(row=i, column=2, padx=(0, 10), pady=pady)
+            level['desc'].grid(row=i, column=3, padx=(0, 10), pady=pady)
+            # Основной уровень удалить нельзя
+            if i == 0:
+                level['remove'].grid_remove()
+            else:
+                level['remove'].grid(row=i, column=4, pady=pady)
+
+    def get_sort_spec(self):
+        """Уровни сортировки из настроек: список пар (поле, по убыванию)"""
+        spec = []
+        for level in self.sort_levels:
+            field_text = level['field'].get()
+            field = field_text.split(' - ')[0] if ' - ' in field_text else field_text
+            spec.append((field, level['order'].get() == "desc"))
+        return spec
+
+    def external_sort(self):
+        """Сортировка файла порциями с записью в новый файл (для файлов, не помещающихся в памяти)"""
+        if not self.filename:
+            messagebox.showwarning("Предупреждение", "Сначала выберите файл")
+            return
+
+        try:
+            memory_budget = int(self.memory_budget_var.get()) * 1024 * 1024
+        except ValueError:
+            messagebox.showerror("Ошибка", "Лимит памяти должен быть целым числом мегабайт")
+            return
+
+        target = filedialog.asksaveasfilename(
+            title="Сохранить отсортированный файл",
+            defaultextension=".csv",
+            initialfile=os.path.basename(self.filename),
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if not target:
+            return
+
+        sorter = ExternalSorter(self.filename, target, self.get_sort_spec(), memory_budget=memory_budget)
+
+        BackgroundTask(
+            self.window,
+            "Сортировка файла",
+            sorter.run,
+            lambda count: self.on_external_sort_done(target, count),
+            on_error=lambda error: messagebox.showerror("Ошибка", f"Ошибка сортировки файла: {str(error)}"),
+            on_cancel=lambda: self.status_var.set("Сортировка файла отменена")
+        ).start()
+
+    def on_external_sort_done(self, target, count):
+        """Завершение внешней сортировки"""
+        self.datasets.invalidate(target)
+        self.status_var.set(f"Файл отсортирован: {count} записей сохранено в {os.path.basename(target)}")
+        messagebox.showinfo("Успех", f"Файл отсортирован и сохранен\nЗаписей: {count}")
+
     def sort_by_column(self, column):
         """Сортировка по клику на заголовок столбца"""
         if not self.records:
             return
+        if not self.can_sort():
+            return
 
         # Определяем направление сортировки
         if column in self.column_sort_order:
@@ -291,67 +481,112 @@ class FileSorter:
         reverse = self.column_sort_order[column]
 
         try:
-            self.records.sort(
-                key=lambda x: self.get_sort_key(x, column),
-                reverse=reverse
-            )
-
-            self.refresh_table()
-
             order_text = "убыванию" if reverse else "возрастанию"
-            self.status_var.set(f"Данные отсортированы по '{column}' по {order_text}")
+            self.sort_rows(column, reverse,
+                           lambda: self.show_sorted(f"Данные отсортированы по '{column}' по {order_text}"))
 
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка сортировки по столбцу: {str(e)}")
 
     def quick_sort_name(self):
         """Быстрая сортировка по названию браузера"""
-        if not self.records:
-            messagebox.showwarning("Предупреждение", "Нет данных для сортировки")
+        self.quick_sort('browser_name', "Данные отсортированы по названию браузера (А-Я)")
+
+    def quick_sort_date(self):
+        """Быстрая сортировка по дате выпуска"""
+        self.quick_sort('release_date', "Данные отсортированы по дате выпуска (старые → новые)")
+
+    def quick_sort_developer(self):
+        """Быстрая сортировка по разработчику"""
+        self.quick_sort('developer', "Данные отсортированы по разработчику (А-Я)")
+
+    def quick_sort(self, field, text):
+        """Быстрая сортировка по полю по возрастанию"""
+        if not self.can_sort():
             return
 
         try:
-            self.records.sort(key=lambda x: x.get('browser_name', '').lower())
-            self.refresh_table()
-            self.status_var.set("Данные отсортированы по названию браузера (А-Я)")
+            self.sort_rows(field, False, lambda: self.show_sorted(text))
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка сортировки: {str(e)}")
 
-    def quick_sort_date(self):
-        """Быстрая сортировка по дате выпуска"""
+    def restore_original(self):
+        """Восстановление исходного порядка записей"""
         if not self.records:
-            messagebox.showwarning("Предупреждение", "Нет данных для сортировки")
+            messagebox.showwarning("Предупреждение", "Нет исходных данных")
+            return
+
+        self.order = list(self.records.row_ids())
+        self.sort_task = None
+        self.last_sort = None
+        self.sort_spec = None
+        self.partial = False
+        self.refresh_table()
+        self.status_var.set("Восстановлен исходный порядок записей")
+
+    def save_order_index(self):
+        """Сохранение текущего порядка сортировки в файл-спутник рядом с CSV файлом"""
+        if not self.records or self.sort_spec is None:
+            messagebox.showwarning("Предупреждение", "Сначала отсортируйте данные")
+            return
+
+        if self.partial:
+            messagebox.showwarning("Предупреждение", "Показаны только первые N записей. Выполните полную сортировку")
             return
 
         try:
-            self.records.sort(key=lambda x: self.get_sort_key(x, 'release_date'))
-            self.refresh_table()
-            self.status_var.set("Данные отсортированы по дате выпуска (старые → новые)")
+            # Индекс хранит смещения строк, поэтому таблица должна совпадать с файлом на диске
+            fingerprint = file_fingerprint(self.filename)
+            offsets = self.records.offsets
+            if (self.datasets.lookup(self.filename, fingerprint) is not self.records or
+                    offsets is None or len(offsets) != self.records.size):
+                # Без записи в кэше повторная загрузка прочитает файл и заново получит смещения строк
+                self.datasets.invalidate(self.filename)
+                messagebox.showwarning("Предупреждение",
+                                       "Данные отличаются от файла на диске. Загрузите файл заново")
+                return
+
+            path = save_sort_index(self.filename, fingerprint, self.sort_spec,
+                                   [offsets[row_id] for row_id in self.order])
+            self.status_var.set(f"Индекс порядка сохранен: {os.path.basename(path)}")
+
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка сортировки: {str(e)}")
+            messagebox.showerror("Ошибка", f"Ошибка сохранения индекса порядка: {str(e)}")
 
-    def quick_sort_developer(self):
-        """Быстрая сортировка по разработчику"""
-        if not self.records:
-            messagebox.showwarning("Предупреждение", "Нет данных для сортировки")
+    def open_order_index(self):
+        """Открытие файла в порядке, сохраненном для выбранных полей и направления сортировки"""
+        if not self.filename:
+            messagebox.showwarning("Предупреждение", "Сначала выберите файл")
             return
 
+        spec = self.get_sort_spec()
+
         try:
-            self.records.sort(key=lambda x: x.get('developer', '').lower())
-            self.refresh_table()
-            self.status_var.set("Данные отсортированы по разработчику (А-Я)")
+            offsets = load_sort_index(self.filename, file_fingerprint(self.filename), spec)
+            if offsets is None:
+                messagebox.showinfo("Информация", "Для выбранной сортировки нет актуального индекса порядка")
+                return
+
+            self.datasets.load(self.window, self.filename,
+                               lambda table: self.apply_order_index(table, spec, offsets),
+                               on_error=self.on_load_error,
+                               on_cancel=lambda: self.status_var.set("Загрузка отменена"))
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка сортировки: {str(e)}")
+            messagebox.showerror("Ошибка", f"Ошибка открытия индекса порядка: {str(e)}")
 
-    def restore_original(self):
-        """Восстановление исходного порядка записей"""
-        if not self.original_records:
-            messagebox.showwarning("Предупреждение", "Нет исходных данных")
+    def apply_order_index(self, table, spec, offsets):
+        """Отображение загруженных данных в сохраненном порядке без сортировки"""
+        self.on_data_loaded(table)
+
+        rows = offsets_to_rows(table, offsets)
+        if rows is None:
+            messagebox.showwarning("Предупреждение", "Индекс порядка не соответствует загруженным данным")
             return
 
-        self.records = [record.copy() for record in self.original_records]
+        self.order = rows
+        self.sort_spec = spec
         self.refresh_table()
-        self.status_var.set("Восстановлен исходный порядок записей")
+        self.status_var.set(f"Данные открыты в сохраненном порядке по {', '.join(field for field, _ in spec)}")
 
     def save_data(self):
         """Сохранение данных в файл"""
@@ -363,11 +598,40 @@ class FileSorter:
             messagebox.showwarning("Предупреждение", "Нет данных для сохранения")
             return
 
+        if self.partial:
+            # Иначе в файл попали бы только показанные записи
+            messagebox.showwarning("Предупреждение",
+                                   "Показаны только первые N записей. Восстановите порядок или выполните "
+                                   "полную сортировку перед сохранением")
+            return
+
+        # Журнал изменений таблицы, открытый в окнах редактирования и удаления
+        journal = EditJournal.of(self.records, self.filename)
+        if journal is not None and journal.running:
+            messagebox.showwarning("Предупреждение", "Файл записывается в другом окне, дождитесь завершения")
+            return
+
         try:
-            with open(self.filename, 'w', encoding='utf-8', newline='') as file:
-                writer = csv.DictWriter(file, fieldnames=self.headers)
+            # Файл, измененный после загрузки (например, массовой операцией в другом окне),
+            # не перезаписывается устаревшей таблицей
+            if self.records.fingerprint != file_fingerprint(self.filename):
+                raise FileChangedError()
+
+            # Строки, удаленные в других окнах после загрузки, не записываем
+            rows = [row_id for row_id in self.order if self.records.is_live(row_id)]
+            with atomic_open(self.filename) as file:
+                writer = csv.DictWriter(file, fieldnames=self.records.headers)
                 writer.writeheader()
-                writer.writerows(self.records)
+                writer.writerows(map(self.records.__getitem__, rows))
+
+            # Строки файла теперь идут в порядке сортировки: смещения и кэш таблицы устарели,
+            # а журнал продолжается от записанного файла (изменения из него уже в файле)
+            self.records.offsets = None
+            self.records.fingerprint = file_fingerprint(self.filename)
+            self.datasets.invalidate(self.filename)
+            if journal is not None:
+                journal.saved(rows)
+            self.records.modified = False
 
             messagebox.showinfo("Успех", "Данные успешно сохранены")
             self.status_var.set("Отсортированные данные сохранены в файл")
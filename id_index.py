@@ -0,0 +1,262 @@
+"""
+Модуль хэш-индекса идентификаторов записей для быстрой проверки уникальности и выдачи новых ID
+"""
+
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from itertools import compress
+
+from data_table import integer_value
+
+# Поле идентификатора записи
+ID_FIELD = "browser_id"
+
+# Отметка свободной ячейки хэш-таблицы
+EMPTY = 0xFFFFFFFF
+
+# Разрядность перемешанного хэша
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def mix_hash(value):
+    """Перемешанный хэш значения (функция splitmix64)
+
+    Хэш целого числа - само число, поэтому без перемешивания ID с шагом, кратным степени двойки,
+    попадали бы в одни и те же ячейки, и поиск становился бы линейным
+    """
+    key = hash(value) & HASH_MASK
+    key = ((key ^ (key >> 30)) * 0xBF58476D1CE4E5B9) & HASH_MASK
+    key = ((key ^ (key >> 27)) * 0x94D049BB133111EB) & HASH_MASK
+    return key ^ (key >> 31)
+
+# Отметка нечислового значения (и нижняя граница всех чисел)
+NO_NUMBER = -2 ** 63
+
+
+def parse_number(value):
+    """Числовое значение ID (NO_NUMBER для нечисловых значений)"""
+    try:
+        number = int(value)
+    except ValueError:
+        return NO_NUMBER
+    if not NO_NUMBER < number < 2 ** 63:
+        return NO_NUMBER
+    return number
+
+
+class IdIndex:
+    """Хэш-индекс значения поля -> id строк таблицы
+
+    Индекс с открытой адресацией: ячейки массива хранят только id строк, а значения для сравнения
+    берутся из самой таблицы, поэтому индекс занимает 8-16 байт на строку при любом способе
+    хранения колонки. Добавленные строки индексируются при обращении, измененные - сразу
+    (таблица сообщает об изменении через on_update), а удаленные и устаревшие строки остаются
+    в ячейках и пропускаются при поиске до перестроения индекса при его заполнении.
+    Числовые ID хранятся еще и по возрастанию: новые и измененные значения вставляются на свое
+    место, а записи удаленных и измененных строк снимаются с конца при запросе наибольшего ID,
+    поэтому после удаления строки с наибольшим ID колонка заново не просматривается
+    """
+
+    def __init__(self, table, field=ID_FIELD):
+        self.table = table
+        self.field = field
+        # Ячейки хэш-таблицы (id строк), маска номера ячейки, сдвиг старших битов перемешанного хэша
+        # (номер начальной ячейки) и количество занятых ячеек
+        self.slots = None
+        self.mask = 0
+        self.shift = HASH_BITS
+        self.used = 0
+        # Признак хэширования по числовым значениям колонки
+        self.numeric = False
+        # Количество проиндексированных строк таблицы
+        self.size = 0
+        # Числовые ID по возрастанию и строки с ними (строятся при первом запросе наибольшего ID);
+        # записи могут устареть после удаления или изменения строки
+        self.ranked_numbers = None
+        self.ranked_rows = None
+        # Числовые ID, занятые записями, которых еще нет в таблице (с количеством записей)
+        self.claimed = Counter()
+
+    @classmethod
+    def for_table(cls, table, field=ID_FIELD):
+        """Общий для всех окон индекс таблицы"""
+        return table.get_index(('id', field), lambda table: cls(table, field))
+
+    def build(self, size):
+        """Построение хэш-таблицы по неудаленным строкам с id меньше size"""
+        column = self.table.columns[self.field]
+        # Заполнение ячеек не больше половины - короткие цепочки при поиске
+        capacity = 8
+        while capacity < 2 * self.table.live_count + 2:
+            capacity *= 2
+        slots = array('I', [EMPTY]) * capacity
+        mask = capacity - 1
+        shift = HASH_BITS - capacity.bit_length() + 1
+
+        # Колонка из целых чисел хэшируется по самим числам, без получения строк значений
+        numbers = getattr(column.values, 'numbers', None)
+        self.numeric = numbers is not None
+        source = numbers if self.numeric else column.values
+        keys = map(source.__getitem__, column.codes[:size])
+
+        used = 0
+        for row_id, key in compress(enumerate(keys), self.table.live):
+            position = mix_hash(key) >> shift
+            while slots[position] != EMPTY:
+                position = (position + 1) & mask
+            slots[position] = row_id
+            used += 1
+
+        self.slots = slots
+        self.mask = mask
+        self.shift = shift
+        self.used = used
+        self.size = size
+
+    def home(self, value):
+        """Начальная ячейка поиска значения"""
+        if self.numeric:
+            value = integer_value(value)
+        return mix_hash(value) >> self.shift
+
+    def check_storage(self):
+        """Перестроение, если колонка перестала хранить значения целыми числами (ключи хэширования изменились)"""
+        if self.numeric and getattr(self.table.columns[self.field].values, 'numbers', None) is None:
+            self.build(self.size)
+
+    def add(self, row_id):
+        """Добавление строки в индекс с ее текущим значением"""
+        column = self.table.columns[self.field]
+        self.check_storage()
+        if 2 * (self.used + 1) > len(self.slots):
+            # Перестроение отбрасывает ячейки удаленных и измененных строк
+            self.build(self.size)
+
+        slots = self.slots
+        mask = self.mask
+        position = self.home(column[row_id])
+        while slots[position] != EMPTY:
+            position = (position + 1) & mask
+        slots[position] = row_id
+        self.used += 1
+
+        if self.ranked_numbers is not None:
+            number = parse_number(column[row_id])
+            if number != NO_NUMBER:
+                self.insert_number(number, row_id)
+
+    def refresh(self):
+        """Индексация строк, добавленных в таблицу после последнего обращения"""
+        size = self.table.size
+        if self.slots is None:
+            self.build(size)
+            return
+
+        for row_id in range(self.size, size):
+            if self.table.live[row_id]:
+                self.add(row_id)
+            self.size = row_id + 1
+
+    def on_update(self, row_id):
+        """Учет измененной строки (вызывается таблицей)"""
+        if self.slots is not None and row_id < self.size:
+            self.add(row_id)
+
+    def find(self, value, exclude=None):
+        """Id неудаленной строки с заданным значением (кроме строки exclude) или None"""
+        self.refresh()
+        self.check_storage()
+        column = self.table.columns[self.field]
+        live = self.table.live
+        slots = self.slots
+        mask = self.mask
+
+        position = self.home(value)
+        while True:
+            row_id = slots[position]
+            if row_id == EMPTY:
+                return None
+            # В ячейках остаются удаленные строки и прежние значения измененных строк
+            if row_id != exclude and live[row_id] and column[row_id] == value:
+                return row_id
+            position = (position + 1) & mask
+
+    def build_ranked(self):
+        """Построение упорядоченных числовых ID неудаленных строк"""
+        column = self.table.columns[self.field]
+        values = column.values
+        # Числовые значения по кодам (каждое различное значение разбирается один раз)
+        numbers = getattr(values, 'numbers', None)
+        if numbers is None:
+            try:
+                # Обычно все ID - числа, и их можно разобрать без проверки каждого значения
+                numbers = array('q', map(int, values))
+            except (ValueError, OverflowError):
+                numbers = array('q', map(parse_number, values))
+
+        keys = array('q', map(numbers.__getitem__, column.codes[:self.size]))
+        rows = [row_id for row_id in compress(range(self.size), self.table.live) if keys[row_id] != NO_NUMBER]
+        # ID обычно растут вместе с номерами строк, и сортировка почти упорядоченных данных быстрая
+        rows.sort(key=keys.__getitem__)
+        self.ranked_rows = array('I', rows)
+        self.ranked_numbers = array('q', map(keys.__getitem__, rows))
+
+    def insert_number(self, number, row_id):
+        """Вставка числового ID строки на свое место (новые наибольшие ID - в конец)"""
+        if len(self.ranked_rows) > 2 * self.table.live_count + 1024:
+            # Устаревших записей слишком много - упорядоченные ID строятся заново при запросе
+            self.ranked_numbers = self.ranked_rows = None
+            return
+        position = bisect_right(self.ranked_numbers, number)
+        self.ranked_numbers.insert(position, number)
+        self.ranked_rows.insert(position, row_id)
+
+    def max_id(self):
+        """Наибольший числовой ID среди неудаленных строк (0, если таких строк нет)"""
+        self.refresh()
+        if self.ranked_numbers is None:
+            self.build_ranked()
+
+        column = self.table.columns[self.field]
+        live = self.table.live
+        numbers = self.ranked_numbers
+        rows = self.ranked_rows
+        while numbers:
+            number = numbers[-1]
+            row_id = rows[-1]
+            if live[row_id] and parse_number(column[row_id]) == number:
+                return number
+            # Строка удалена или ее ID изменен
+            numbers.pop()
+            rows.pop()
+        return 0
+
+    def next_id(self):
+        """Следующий свободный числовой ID (больше всех ID таблицы и всех занятых ID)"""
+        return max(self.max_id(), max(self.claimed, default=0)) + 1
+
+    def claim(self, value):
+        """Учет ID, занятого записью, которой еще нет в таблице (например, несохраненной новой записью)"""
+        number = parse_number(value)
+        if number != NO_NUMBER:
+            self.claimed[number] += 1
+
+    def release(self, value):
+        """Освобождение ID, занятого через claim (запись убрана из списка или сохранена в таблицу)"""
+        number = parse_number(value)
+        if self.claimed[number] > 1:
+            self.claimed[number] -= 1
+        else:
+            self.claimed.pop(number, None)
+
+    def reserve(self, count=1):
+        """Выдача count новых ID подряд (для массового добавления записей), возвращает range"""
+        start = self.next_id()
+        ids = range(start, start + count)
+        self.claimed.update(ids)
+        return ids
+
+    def __contains__(self, value):
+        return self.find(value) is not None
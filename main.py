@@ -17,6 +17,10 @@ from file_sorter import FileSorter
 from calculator import Calculator
 from result_printer import ResultPrinter
 from chart_viewer import ChartViewer
+from dataset_cache import DatasetCache
+
+# Лимит памяти общего кэша наборов данных (байт)
+DATASET_MEMORY_BUDGET = 1024 * 1024 * 1024
 
 
 class MainApplication:
@@ -123,15 +127,18 @@ class MainApplication:
     def init_modules(self):
         """Инициализация модулей"""
         try:
+            # Общий кэш разобранных файлов для всех окон
+            self.datasets = DatasetCache(memory_budget=DATASET_MEMORY_BUDGET)
+
             self.file_creator = FileCreator(self.root)
-            self.file_printer = FilePrinter(self.root)
-            self.record_adder = RecordAdder(self.root)
-            self.record_editor = RecordEditor(self.root)
-            self.record_deleter = RecordDeleter(self.root)
-            self.file_sorter = FileSorter(self.root)
-            self.calculator = Calculator(self.root)
-            self.result_printer = ResultPrinter(self.root)
-            self.chart_viewer = ChartViewer(self.root)
+            self.file_printer = FilePrinter(self.root, self.datasets)
+            self.record_adder = RecordAdder(self.root, self.datasets)
+            self.record_editor = RecordEditor(self.root, self.datasets)
+            self.record_deleter = RecordDeleter(self.root, self.datasets)
+            self.file_sorter = FileSorter(self.root, self.datasets)
+            self.calculator = Calculator(self.root, self.datasets)
+            self.result_printer = ResultPrinter(self.root, self.datasets)
+            self.chart_viewer = ChartViewer(self.root, self.datasets)
 
             self.status_var.set("Все модули загружены успешно")
         except Exception as e:
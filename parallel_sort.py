@@ -0,0 +1,153 @@
+"""
+Модуль параллельной сортировки строк по целочисленным ключам в нескольких процессах
+"""
+
+import multiprocessing
+import os
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+# Минимальное количество строк, начиная с которого сортировка выполняется параллельно
+PARALLEL_SORT_ROWS = 1000000
+
+# Количество процессов-исполнителей: при меньшем числе ядер затраты на передачу ключей и порядка
+# строк через общую память не окупаются, и строки сортируются одной сортировкой
+MIN_WORKERS = 4
+MAX_WORKERS = 8
+
+# Количество образцов ключей из каждой части для выбора границ диапазонов
+SAMPLES_PER_CHUNK = 256
+
+# Размер элемента общей памяти (байт): ключи, порядок строк и результат хранятся как 'q'
+ITEM_SIZE = 8
+
+# Общий пул процессов-исполнителей (создается при первой параллельной сортировке)
+executor = None
+
+
+def worker_count(count):
+    """Количество процессов для сортировки count строк (1 - сортировка в текущем процессе)"""
+    workers = min(os.cpu_count() or 1, MAX_WORKERS)
+    if count < PARALLEL_SORT_ROWS or workers < MIN_WORKERS:
+        return 1
+    return workers
+
+
+def get_executor(workers):
+    """Общий пул процессов: процессы запускаются один раз и переиспользуются следующими сортировками"""
+    global executor
+    if executor is None:
+        # Запуск процессов без fork: окно приложения работает в нескольких потоках
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return executor
+
+
+def read_items(memory, start, end):
+    """Копия элементов общей памяти с номерами от start до end"""
+    items = array('q')
+    items.frombytes(memory.buf[start * ITEM_SIZE:end * ITEM_SIZE])
+    return items
+
+
+def write_items(memory, start, items):
+    """Запись элементов в общую память, начиная с номера start"""
+    memory.buf[start * ITEM_SIZE:(start + len(items)) * ITEM_SIZE] = items.tobytes()
+
+
+def sort_chunk(name, size, count, start, end, reverse):
+    """Устойчивая сортировка части исходного порядка строк (выполняется в процессе-исполнителе)"""
+    memory = SharedMemory(name)
+    try:
+        keys = read_items(memory, 0, size)
+        rows = read_items(memory, size + start, size + end).tolist()
+        rows.sort(key=keys.__getitem__, reverse=reverse)
+        write_items(memory, size + count + start, array('q', rows))
+    finally:
+        memory.close()
+
+
+def merge_bucket(name, size, count, ranges, offset, reverse):
+    """Сборка одного диапазона ключей из отсортированных частей (выполняется в процессе-исполнителе)
+
+    Куски частей идут в порядке частей, поэтому устойчивая сортировка сохраняет исходный порядок
+    равных ключей и сводится к слиянию уже отсортированных серий
+    """
+    memory = SharedMemory(name)
+    try:
+        keys = read_items(memory, 0, size)
+        rows = array('q')
+        for start, end in ranges:
+            rows.extend(read_items(memory, size + count + start, size + count + end))
+        rows = rows.tolist()
+        rows.sort(key=keys.__getitem__, reverse=reverse)
+        write_items(memory, size + 2 * count + offset, array('q', rows))
+    finally:
+        memory.close()
+
+
+def parallel_sort(order, keys, reverse=False, task=None):
+    """Устойчивая сортировка id строк по неотрицательным целым ключам keys[id] в нескольких процессах
+
+    Результат совпадает с sorted(order, key=keys.__getitem__, reverse=reverse). Ключи и порядок
+    строк передаются процессам через общую память, без сериализации списков. Каждый процесс
+    сортирует свою часть строк, затем части делятся на диапазоны ключей по выборке, и каждый
+    процесс собирает свой диапазон - слияние в текущем процессе не нужно.
+    """
+    count = len(order)
+    workers = worker_count(count)
+    if workers == 1:
+        return sorted(order, key=keys.__getitem__, reverse=reverse)
+    try:
+        # Ключи передаются через общую память как 64-битные числа со знаком
+        key_items = array('q', keys)
+    except OverflowError:
+        return sorted(order, key=keys.__getitem__, reverse=reverse)
+
+    size = len(keys)
+    memory = SharedMemory(create=True, size=(size + 3 * count) * ITEM_SIZE)
+    try:
+        # Общая память: ключи по id строк, исходный порядок, отсортированные части, результат
+        write_items(memory, 0, key_items)
+        del key_items
+        write_items(memory, size, array('q', order))
+
+        pool = get_executor(workers)
+        step = (count + workers - 1) // workers
+        chunks = [(start, min(start + step, count)) for start in range(0, count, step)]
+        # Первый проход: каждая часть сортируется отдельно
+        for future in [pool.submit(sort_chunk, memory.name, size, count, start, end, reverse)
+                       for start, end in chunks]:
+            future.result()
+        if task is not None:
+            task.check_cancelled()
+
+        # Границы диапазонов по равномерной выборке из отсортированных частей: равные ключи
+        # попадают в один диапазон (при сортировке по убыванию части упорядочены по убыванию ключей)
+        key = keys.__getitem__ if not reverse else (lambda row_id: -keys[row_id])
+        rows = memory.buf.cast('q')[size + count:size + 2 * count]
+        try:
+            sample = sorted(key(rows[start + (end - start) * i // SAMPLES_PER_CHUNK])
+                            for start, end in chunks for i in range(SAMPLES_PER_CHUNK))
+            splitters = [sample[len(sample) * i // workers] for i in range(1, workers)]
+            cuts = [[start] + [bisect_left(rows, splitter, start, end, key=key) for splitter in splitters] + [end]
+                    for start, end in chunks]
+        finally:
+            # Общую память нельзя закрыть, пока на нее есть ссылки
+            rows.release()
+
+        # Второй проход: каждый процесс собирает свой диапазон ключей из всех частей
+        futures = []
+        offset = 0
+        for bucket in range(workers):
+            ranges = [(chunk_cuts[bucket], chunk_cuts[bucket + 1]) for chunk_cuts in cuts]
+            futures.append(pool.submit(merge_bucket, memory.name, size, count, ranges, offset, reverse))
+            offset += sum(end - start for start, end in ranges)
+        for future in futures:
+            future.result()
+
+        return read_items(memory, size + 2 * count, size + 3 * count).tolist()
+    finally:
+        memory.close()
+        memory.unlink()
@@ -6,14 +6,21 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import csv
 import os
-from datetime import datetime
+
+from atomic_writer import WRITE_BUFFER_SIZE, atomic_open
+from backup_store import BackupStore
+from dataset_cache import DatasetCache, OffsetWriter, file_fingerprint, spread_offsets
+from edit_journal import EditJournal, FileChangedError
+from id_index import IdIndex
 
 
 class RecordAdder:
     """Класс для добавления записей в CSV файл с данными о браузерах"""
 
-    def __init__(self, parent):
+    def __init__(self, parent, datasets=None):
         self.parent = parent
+        # Общий кэш загруженных наборов данных
+        self.datasets = datasets if datasets is not None else DatasetCache()
         self.window = None
         self.entries = {}
         self.data = []
@@ -269,11 +276,17 @@ class RecordAdder:
             command=self.preview_changes
         ).grid(row=0, column=1, padx=5)
 
+        ttk.Button(
+            save_buttons_frame,
+            text="Резервные копии",
+            command=self.show_backups
+        ).grid(row=0, column=2, padx=5)
+
         ttk.Button(
             save_buttons_frame,
             text="Закрыть",
             command=self.close_window
-        ).grid(row=0, column=2, padx=5)
+        ).grid(row=0, column=3, padx=5)
 
         # Привязываем события
         self.tree.bind('<Double-1>', self.edit_selected)
@@ -289,28 +302,34 @@ class RecordAdder:
             self.load_existing_file(filename)
 
     def load_existing_file(self, filename):
-        """Загрузить существующий файл"""
+        """Загрузить существующий файл (чтение выполняется в фоновом потоке)"""
         try:
-            self.data.clear()
-
-            # Читаем существующий файл
-            with open(filename, 'r', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-
-                # Проверяем наличие необходимых полей
-                if not all(field in reader.fieldnames for field in self.fields.keys()):
-                    missing_fields = [field for field in self.fields.keys()
-                                      if field not in reader.fieldnames]
-                    messagebox.showerror(
-                        "Ошибка",
-                        f"В файле отсутствуют обязательные поля:\n{', '.join(missing_fields)}"
-                    )
-                    return
-
-                # Читаем данные
-                for row in reader:
-                    record = {field: row.get(field, '').strip() for field in self.fields.keys()}
-                    self.data.append(record)
+            self.datasets.load(
+                self.window,
+                filename,
+                lambda table: self.on_file_loaded(filename, table),
+                on_error=self.show_load_error
+            )
+        except Exception as e:
+            self.show_load_error(e)
+
+    def on_file_loaded(self, filename, table):
+        """Обработка загруженного файла"""
+        try:
+            # Проверяем наличие необходимых полей
+            if not all(field in table.headers for field in self.fields.keys()):
+                missing_fields = [field for field in self.fields.keys()
+                                  if field not in table.headers]
+                messagebox.showerror(
+                    "Ошибка",
+                    f"В файле отсутствуют обязательные поля:\n{', '.join(missing_fields)}"
+                )
+                return
+
+            self.data = table
+            # Индекс ID и наибольший ID строятся сразу, чтобы первая проверка уникальности
+            # и первая генерация ID не ждали их построения
+            IdIndex.for_table(self.data).max_id()
 
             # Обновляем информацию о файле
             self.current_file = filename
@@ -330,10 +349,14 @@ class RecordAdder:
             )
 
         except Exception as e:
-            messagebox.showerror(
-                "Ошибка",
-                f"Ошибка при загрузке файла:\n{str(e)}"
-            )
+            self.show_load_error(e)
+
+    def show_load_error(self, error):
+        """Показать ошибку загрузки файла"""
+        messagebox.showerror(
+            "Ошибка",
+            f"Ошибка при загрузке файла:\n{str(error)}"
+        )
 
     def generate_id(self):
         """Автоматическая генерация ID"""
@@ -344,25 +367,9 @@ class RecordAdder:
             )
             return
 
-        # Находим максимальный существующий ID
-        existing_ids = []
-
-        # ID из загруженного файла
-        for record in self.data:
-            try:
-                existing_ids.append(int(record.get('browser_id', 0)))
-            except ValueError:
-                continue
-
-        # ID из новых записей
-        for record in self.new_records:
-            try:
-                existing_ids.append(int(record.get('browser_id', 0)))
-            except ValueError:
-                continue
-
-        # Генерируем новый ID
-        new_id = max(existing_ids, default=0) + 1
+        # Наибольший ID файла поддерживается индексом ID при изменениях таблицы,
+        # а ID новых записей учитываются в нем при добавлении записей в список
+        new_id = IdIndex.for_table(self.data).next_id()
 
         self.entries['browser_id'].delete(0, tk.END)
         self.entries['browser_id'].insert(0, str(new_id))
@@ -441,15 +448,14 @@ class RecordAdder:
         # Проверяем уникальность ID
         browser_id = record['browser_id']
 
-        # Проверяем в существующих записях
-        for existing_record in self.data:
-            if existing_record['browser_id'] == browser_id:
-                messagebox.showwarning(
-                    "Предупреждение",
-                    f"Браузер с ID '{browser_id}' уже существует в файле!"
-                )
-                self.entries['browser_id'].focus()
-                return
+        # Проверяем в существующих записях (по хэш-индексу, без просмотра всего файла)
+        if IdIndex.for_table(self.data).find(browser_id) is not None:
+            messagebox.showwarning(
+                "Предупреждение",
+                f"Браузер с ID '{browser_id}' уже существует в файле!"
+            )
+            self.entries['browser_id'].focus()
+            return
 
         # Проверяем в новых записях
         for new_record in self.new_records:
@@ -463,6 +469,7 @@ class RecordAdder:
 
         # Добавляем запись
         self.new_records.append(record)
+        IdIndex.for_table(self.data).claim(browser_id)
         self.tree.insert('', tk.END, values=list(record.values()))
 
         # Обновляем статистику
@@ -492,8 +499,8 @@ class RecordAdder:
             # Получаем индекс записи
             item_index = self.tree.index(selected_item[0])
 
-            # Удаляем из списка новых записей и из дерева
-            del self.new_records[item_index]
+            # Удаляем из списка новых записей и из дерева, ID записи снова свободен
+            self.release_id(self.new_records.pop(item_index))
             self.tree.delete(selected_item[0])
 
             self.update_stats()
@@ -520,10 +527,14 @@ class RecordAdder:
                     widget.insert(0, value)
 
         # Удаляем запись из списка (будет добавлена заново при нажатии "Добавить")
-        del self.new_records[item_index]
+        self.release_id(self.new_records.pop(item_index))
         self.tree.delete(selected_item[0])
         self.update_stats()
 
+    def release_id(self, record):
+        """Освобождение ID записи, убранной из списка новых записей"""
+        IdIndex.for_table(self.data).release(record['browser_id'])
+
     def clear_new_records(self):
         """Очистить список новых записей"""
         if not self.new_records:
@@ -531,6 +542,8 @@ class RecordAdder:
             return
 
         if messagebox.askyesno("Подтверждение", "Очистить весь список новых записей?"):
+            for record in self.new_records:
+                self.release_id(record)
             self.new_records.clear()
             for item in self.tree.get_children():
                 self.tree.delete(item)
@@ -610,47 +623,83 @@ class RecordAdder:
             messagebox.showwarning("Предупреждение", "Нет новых записей для сохранения!")
             return
 
+        # Журнал изменений таблицы, открытый в окнах редактирования и удаления
+        journal = EditJournal.of(self.data, self.current_file)
+        if journal is not None and journal.running:
+            messagebox.showwarning("Предупреждение", "Файл записывается в другом окне, дождитесь завершения")
+            return
+
         if messagebox.askyesno(
                 "Подтверждение",
                 f"Добавить {len(self.new_records)} новых записей в файл?\n"
                 f"Файл: {os.path.basename(self.current_file)}"
         ):
             try:
-                # Читаем существующие данные
-                all_data = self.data.copy()
-
-                # Добавляем новые записи
-                all_data.extend(self.new_records)
-
-                # Сохраняем в файл
-                with open(self.current_file, 'w', newline='', encoding='utf-8') as csvfile:
-                    fieldnames = list(self.fields.keys())
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-                    writer.writeheader()
-                    for record in all_data:
-                        writer.writerow(record)
-
-                # Создаем резервную копию с информацией о добавлении
-                backup_name = f"{self.current_file}.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                with open(backup_name, 'w', newline='', encoding='utf-8') as csvfile:
-                    fieldnames = list(self.fields.keys())
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-                    writer.writeheader()
-                    for record in self.data:
-                        writer.writerow(record)
+                # Файл, измененный после загрузки (например, массовым удалением в другом окне),
+                # не перезаписывается устаревшей таблицей
+                if self.data.fingerprint != file_fingerprint(self.current_file):
+                    raise FileChangedError()
+
+                # Резервная копия: при первом сохранении - снимок файла, далее - только изменения
+                store = BackupStore(self.current_file)
+                store.begin(self.data.headers)
+
+                headers = self.data.headers
+                new_rows = [[record.get(header) or '' for header in headers] for record in self.new_records]
+
+                offsets = None
+                appended = self.can_append()
+                if appended:
+                    # Дописываем только новые записи в конец файла
+                    offsets = self.append_to_file()
+                    store.commit(added=new_rows)
+                else:
+                    # Сохраняем в файл существующие и новые записи
+                    with atomic_open(self.current_file) as csvfile:
+                        recorder = OffsetWriter(csvfile)
+                        writer = csv.DictWriter(recorder, fieldnames=headers, extrasaction='ignore')
+
+                        writer.writeheader()
+                        writer.writerows(self.data)
+                        writer.writerows(self.new_records)
+
+                    # Смещения записанных строк: сохраненные строки таблицы, затем новые записи
+                    rows = list(self.data.row_ids())
+                    rows.extend(range(self.data.size, self.data.size + len(self.new_records)))
+                    offsets = spread_offsets(self.data.size + len(self.new_records), rows,
+                                             recorder.offsets[1:], recorder.position)
+
+                    # Таблица могла быть изменена в других окнах - файл сравнивается с последней точкой
+                    # восстановления потоком, без загрузки обоих состояний в память
+                    store.record()
+
+                # Добавляем новые записи в таблицу данных и обновляем кэш
+                for record in self.new_records:
+                    self.data.append(record)
+                self.datasets.put(self.current_file, self.data)
+                # Смещения строк в записанном файле (для индексов порядка и изменения строк на месте)
+                self.data.offsets = offsets
+
+                if journal is not None:
+                    if appended:
+                        # Номера прежних строк файла не изменились, изменения из журнала еще не записаны
+                        journal.rebind(file_fingerprint(self.current_file))
+                        self.data.modified = bool(journal.entries)
+                    else:
+                        # Файл записан из таблицы вместе с изменениями из журнала
+                        journal.saved(self.data.row_ids())
 
                 messagebox.showinfo(
                     "Успех",
                     f"Записи успешно добавлены в файл!\n"
                     f"Добавлено записей: {len(self.new_records)}\n"
-                    f"Общее количество записей: {len(all_data)}\n"
-                    f"Создана резервная копия: {os.path.basename(backup_name)}"
+                    f"Общее количество записей: {len(self.data)}\n"
+                    f"Точек восстановления: {len(store.points())}"
                 )
 
-                # Обновляем данные и очищаем список новых записей
-                self.data = all_data
+                # Очищаем список новых записей: их ID теперь учитываются по таблице
+                for record in self.new_records:
+                    self.release_id(record)
                 self.new_records.clear()
                 for item in self.tree.get_children():
                     self.tree.delete(item)
@@ -666,6 +715,103 @@ class RecordAdder:
                     f"Ошибка при сохранении файла:\n{str(e)}"
                 )
 
+    def show_backups(self):
+        """Окно точек восстановления файла"""
+        if not self.current_file:
+            messagebox.showwarning("Предупреждение", "Файл не выбран!")
+            return
+
+        store = BackupStore(self.current_file)
+        points = store.points()
+        if not points:
+            messagebox.showinfo("Резервные копии", "Для этого файла еще нет резервных копий")
+            return
+
+        backup_window = tk.Toplevel(self.window)
+        backup_window.title("Резервные копии")
+        backup_window.geometry("500x350")
+        backup_window.transient(self.window)
+
+        frame = ttk.Frame(backup_window, padding="10")
+        frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        backup_window.columnconfigure(0, weight=1)
+        backup_window.rowconfigure(0, weight=1)
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(1, weight=1)
+
+        ttk.Label(frame, text=f"Файл: {os.path.basename(self.current_file)}").grid(row=0, column=0, sticky=tk.W)
+
+        points_list = tk.Listbox(frame, height=12)
+        for number, time, description in points:
+            points_list.insert(tk.END, f"{number}. {time}  {description}")
+        points_list.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
+        points_list.selection_set(tk.END)
+
+        def restore():
+            selection = points_list.curselection()
+            if not selection:
+                return
+            number = points[selection[0]][0]
+            if not messagebox.askyesno("Подтверждение",
+                                       f"Восстановить файл в состояние точки {number}?",
+                                       parent=backup_window):
+                return
+            try:
+                store.restore(number)
+                self.datasets.invalidate(self.current_file)
+                backup_window.destroy()
+                self.load_existing_file(self.current_file)
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Ошибка восстановления файла:\n{str(e)}", parent=backup_window)
+
+        buttons_frame = ttk.Frame(frame)
+        buttons_frame.grid(row=2, column=0)
+        ttk.Button(buttons_frame, text="Восстановить", command=restore).grid(row=0, column=0, padx=5)
+        ttk.Button(buttons_frame, text="Закрыть", command=backup_window.destroy).grid(row=0, column=1, padx=5)
+
+    def can_append(self):
+        """Проверка, можно ли дописать новые записи в конец файла без его перезаписи"""
+        # Файл не должен меняться с загрузки или последней записи таблицы. Несохраненные изменения
+        # таблицы не мешают: они остаются в журнале, а номера строк файла не меняются
+        if self.data.fingerprint != file_fingerprint(self.current_file):
+            return False
+
+        # Заголовок файла должен совпадать с порядком колонок, в котором будут записаны строки
+        with open(self.current_file, 'r', encoding='utf-8', newline='') as csvfile:
+            header = next(csv.reader(csvfile), None)
+        return header == self.data.headers
+
+    def append_to_file(self):
+        """Дописывание новых записей в конец файла, возвращает смещения строк файла (или None)"""
+        offsets = self.data.offsets
+        if offsets is not None and len(offsets) != self.data.size:
+            offsets = None
+
+        # Если последняя строка файла не завершена переводом строки, добавляем его
+        with open(self.current_file, 'rb') as csvfile:
+            size = csvfile.seek(0, os.SEEK_END)
+            last_char = b''
+            if size:
+                csvfile.seek(-1, os.SEEK_END)
+                last_char = csvfile.read(1)
+
+        with open(self.current_file, 'a', newline='', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as csvfile:
+            if last_char not in (b'', b'\n'):
+                csvfile.write('\r\n')
+                size += 2
+
+            # Смещения новых строк считаются по длине записанных строк, запись идет одним буфером
+            recorder = OffsetWriter(csvfile, size)
+            writer = csv.DictWriter(recorder, fieldnames=self.data.headers, extrasaction='ignore')
+            writer.writerows(self.new_records)
+
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+
+        if offsets is not None:
+            offsets = offsets + recorder.offsets
+        return offsets
+
     def close_window(self):
         """Закрыть окно"""
         if self.new_records:
@@ -4,19 +4,37 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import csv
 import os
 
+from background_task import BackgroundTask
+from bulk_ops import OPERATORS, BulkDelete
+from data_table import DataTable
+from dataset_cache import DatasetCache
+from edit_journal import EditJournal
+from search_index import BitmapIndex, TrigramIndex, match_rows
+from virtual_table import VirtualTable
+
 
 class RecordDeleter:
     """Класс для удаления записей из файла"""
 
-    def __init__(self, parent):
+    # Задержка перед поиском после последнего нажатия клавиши (мс)
+    SEARCH_DELAY = 200
+
+    def __init__(self, parent, datasets=None):
         self.parent = parent
+        # Общий кэш загруженных наборов данных
+        self.datasets = datasets if datasets is not None else DatasetCache()
         self.window = None
         self.filename = ""
-        self.records = []
         self.headers = ["browser_id", "browser_name", "developer", "release_date", "latest_version", "engine"]
+        self.records = DataTable(self.headers)
+        # Журнал изменений загруженного файла
+        self.journal = None
+
+        # Отложенный поиск и фильтры, которым соответствует текущий список filtered_records
+        self.search_job = None
+        self.filter_state = None
 
     def show(self):
         """Показ окна удаления записей"""
@@ -61,9 +79,11 @@ class RecordDeleter:
         ttk.Button(control_frame, text="Удалить выбранные", command=self.delete_selected).grid(row=0, column=1,
                                                                                                padx=(0, 10))
         ttk.Button(control_frame, text="Удалить все", command=self.delete_all).grid(row=0, column=2, padx=(0, 10))
-        ttk.Button(control_frame, text="Сохранить изменения", command=self.save_data).grid(row=0, column=3,
+        ttk.Button(control_frame, text="Удалить по условию", command=self.delete_by_condition).grid(row=0, column=3,
+                                                                                                    padx=(0, 10))
+        ttk.Button(control_frame, text="Сохранить изменения", command=self.save_data).grid(row=0, column=4,
                                                                                            padx=(0, 10))
-        ttk.Button(control_frame, text="Обновить таблицу", command=self.refresh_table).grid(row=0, column=4)
+        ttk.Button(control_frame, text="Обновить таблицу", command=self.refresh_table).grid(row=0, column=5)
 
         # Фрейм для фильтрации
         filter_frame = ttk.LabelFrame(main_frame, text="Фильтрация и поиск", padding="5")
@@ -89,8 +109,8 @@ class RecordDeleter:
         table_frame.columnconfigure(0, weight=1)
         table_frame.rowconfigure(0, weight=1)
 
-        # Создание Treeview с возможностью множественного выбора
-        self.tree = ttk.Treeview(table_frame, columns=self.headers, show='headings', height=15, selectmode='extended')
+        # Создание виртуальной таблицы с возможностью множественного выбора
+        self.tree = VirtualTable(table_frame, columns=self.headers, height=15, selectmode='extended')
 
         # Настройка заголовков
         column_widths = [80, 150, 150, 100, 120, 120]
@@ -98,15 +118,8 @@ class RecordDeleter:
             self.tree.heading(header, text=header.replace('_', ' ').title())
             self.tree.column(header, width=column_widths[i], minwidth=50)
 
-        # Scrollbars
-        v_scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        h_scrollbar = ttk.Scrollbar(table_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
-        self.tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
-
-        # Размещение таблицы и scrollbars
+        # Размещение таблицы
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
 
         # Привязка событий
         self.tree.bind('<Double-1>', self.on_double_click)
@@ -116,8 +129,7 @@ class RecordDeleter:
         self.status_var.set("Выберите файл для работы с удалением записей")
         ttk.Label(main_frame, textvariable=self.status_var).grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
 
-        # Переменные для фильтрации
-        self.original_records = []
+        # Id строк, прошедших фильтры (в порядке таблицы)
         self.filtered_records = []
 
     def select_file(self):
@@ -139,56 +151,125 @@ class RecordDeleter:
             return
 
         try:
-            self.records = []
-            self.original_records = []
+            self.datasets.load(self.window, self.filename, self.on_data_loaded, on_error=self.on_load_error,
+                               on_cancel=lambda: self.status_var.set("Загрузка отменена"))
+        except Exception as e:
+            self.on_load_error(e)
 
-            with open(self.filename, 'r', encoding='utf-8', newline='') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    self.records.append(row)
-                    self.original_records.append(row.copy())
+    def on_data_loaded(self, table):
+        """Обработка загруженных данных"""
+        self.records = table
 
-            self.filtered_records = self.records.copy()
-            self.update_developer_filter()
-            self.refresh_table()
-            self.status_var.set(f"Загружено {len(self.records)} записей")
+        # Удаления сразу записываются в журнал, поэтому они не теряются при сбое до сохранения
+        self.journal = EditJournal.for_table(self.records, self.filename)
+        self.recover_journal()
 
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка загрузки файла: {str(e)}")
+        # Триграммный индекс по названиям строится один раз и переиспользуется всеми окнами
+        self.name_index = TrigramIndex.for_table(self.records, 'browser_name')
+        self.name_index.update()
+        BitmapIndex.for_table(self.records, 'developer').refresh()
+
+        self.filtered_records = list(self.records.row_ids())
+        self.filter_state = None
+        self.update_developer_filter()
+        self.refresh_table()
+        self.status_var.set(f"Загружено {len(self.records)} записей")
+
+    def recover_journal(self):
+        """Предложение применить изменения, оставшиеся в журнале с прошлой работы с файлом"""
+        entries = self.journal.pending()
+        if not entries:
+            return
+
+        if messagebox.askyesno("Журнал изменений",
+                               f"Найдены несохраненные изменения файла: {len(entries)}\n\n"
+                               "Применить их к загруженным данным?"):
+            self.journal.replay(entries)
+        else:
+            self.journal.discard()
+
+    def on_load_error(self, error):
+        """Обработка ошибки загрузки"""
+        messagebox.showerror("Ошибка", f"Ошибка загрузки файла: {str(error)}")
 
     def update_developer_filter(self):
         """Обновление списка разработчиков для фильтра"""
-        developers = sorted(set(record.get('developer', '') for record in self.original_records))
+        developers = sorted(set(self.records.column_values('developer')))
         developers.insert(0, "Все разработчики")
         self.developer_combo['values'] = developers
         self.developer_combo.set("Все разработчики")
 
     def on_search_change(self, *args):
-        """Обработка изменения поискового запроса"""
-        self.apply_filters()
+        """Обработка изменения поискового запроса (поиск запускается после паузы в наборе)"""
+        self.cancel_search()
+        self.search_job = self.window.after(self.SEARCH_DELAY, self.run_search)
+
+    def cancel_search(self):
+        """Отмена отложенного поиска"""
+        if self.search_job is not None:
+            self.window.after_cancel(self.search_job)
+            self.search_job = None
+
+    def run_search(self):
+        """Выполнение отложенного поиска"""
+        self.search_job = None
+        if self.window.winfo_exists():
+            self.apply_filters()
 
     def on_filter_change(self, *args):
         """Обработка изменения фильтра"""
+        self.cancel_search()
         self.apply_filters()
 
     def apply_filters(self):
         """Применение фильтров к данным"""
         search_text = self.search_var.get().lower()
         selected_developer = self.developer_var.get()
-
-        self.filtered_records = []
-
-        for record in self.records:
-            # Фильтр по поиску
-            if search_text and search_text not in record.get('browser_name', '').lower():
-                continue
-
-            # Фильтр по разработчику
-            if (selected_developer and selected_developer != "Все разработчики" and
-                    record.get('developer', '') != selected_developer):
-                continue
-
-            self.filtered_records.append(record)
+        if selected_developer == "Все разработчики":
+            selected_developer = ""
+
+        # Если непустой запрос только дополнен, а разработчик не менялся, сужаем предыдущий результат
+        # (после пустого запроса быстрее искать по индексу, чем проверять все строки)
+        narrow = (self.filter_state is not None and self.filter_state[1] == selected_developer and
+                  self.filter_state[0] != "" and self.filter_state[0] in search_text)
+
+        if not narrow:
+            # Поиск по триграммному индексу без просмотра всех строк
+            if search_text:
+                rows = TrigramIndex.for_table(self.records, 'browser_name').search(search_text)
+            elif selected_developer:
+                # Без поиска строки разработчика берутся из битовой карты
+                rows = match_rows(self.records, {'developer': selected_developer})
+            else:
+                rows = self.records.row_ids()
+        elif search_text:
+            # Сужение: каждое различное название проверяется один раз, строки отбираются по кодам
+            rows = self.filtered_records
+            names = self.records.columns['browser_name']
+            values = names.values
+            codes = names.codes
+            matches = {}
+            filtered = []
+            for row_id in rows:
+                code = codes[row_id]
+                match = matches.get(code)
+                if match is None:
+                    match = matches[code] = search_text in values[code].lower()
+                if match:
+                    filtered.append(row_id)
+            rows = filtered
+        else:
+            rows = self.filtered_records
+
+        # Фильтр по разработчику для результатов поиска (при сужении он уже применен)
+        if selected_developer and search_text and not narrow:
+            developers = self.records.columns['developer']
+            developer_codes = set(developers.codes_of(selected_developer))
+            codes = developers.codes
+            rows = [row_id for row_id in rows if codes[row_id] in developer_codes]
+
+        self.filtered_records = list(rows)
+        self.filter_state = (search_text, selected_developer)
 
         self.refresh_table()
         self.status_var.set(f"Показано {len(self.filtered_records)} из {len(self.records)} записей")
@@ -196,30 +277,23 @@ class RecordDeleter:
     def reset_filters(self):
         """Сброс всех фильтров"""
         self.search_var.set("")
+        self.cancel_search()
         self.developer_combo.set("Все разработчики")
-        self.filtered_records = self.records.copy()
+        self.filtered_records = list(self.records.row_ids())
+        self.filter_state = ("", "")
         self.refresh_table()
         self.status_var.set(f"Показано {len(self.records)} записей")
 
     def refresh_table(self):
         """Обновление таблицы"""
-        # Очистка таблицы
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # Заполнение таблицы отфильтрованными данными
-        for i, record in enumerate(self.filtered_records):
-            values = [record.get(header, "") for header in self.headers]
-            # Используем исходный индекс записи как iid для корректного удаления
-            original_index = self.records.index(record)
-            self.tree.insert("", tk.END, iid=original_index, values=values)
+        # Отображение отфильтрованных данных (по id строк таблицы)
+        self.tree.set_rows(self.records, self.filtered_records)
 
     def on_double_click(self, event):
         """Обработка двойного клика по записи"""
         selection = self.tree.selection()
         if selection:
-            item_id = selection[0]
-            record_index = int(item_id)
+            record_index = selection[0]
             record = self.records[record_index]
 
             # Показываем информацию о записи
@@ -241,18 +315,26 @@ class RecordDeleter:
             return
 
         try:
-            # Получаем индексы для удаления (сортируем в обратном порядке)
-            indices_to_delete = sorted([int(item_id) for item_id in selection], reverse=True)
-
-            # Удаляем записи
-            for index in indices_to_delete:
-                del self.records[index]
-
-            # Обновляем отфильтрованные записи
-            self.apply_filters()
+            # Показаны ли все записи (тогда список строк проще взять из флагов таблицы)
+            showing_all = len(self.filtered_records) == len(self.records)
+
+            # Удаляем записи по id строк (id остальных строк не меняются)
+            self.records.delete(selection)
+            self.journal.log_delete(selection)
+
+            # Убираем удаленные строки из отфильтрованных без повторной фильтрации
+            if showing_all:
+                self.filtered_records = self.records.row_ids()
+            else:
+                self.filtered_records = self.records.live_rows(self.filtered_records)
+            self.refresh_table()
 
             self.status_var.set(f"Удалено {count} записей. Осталось {len(self.records)} записей")
 
+            # Файл перезаписывается, только когда удаленных строк в нем становится слишком много
+            if self.journal.needs_compaction():
+                self.compact_file()
+
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка удаления записей: {str(e)}")
 
@@ -269,32 +351,153 @@ class RecordDeleter:
             return
 
         try:
-            self.records.clear()
-            self.filtered_records.clear()
+            # Строки помечаются удаленными: id строк и индексы таблицы в других окнах остаются верными
+            self.records.delete(self.records.row_ids())
+            self.journal.log_clear()
+            self.filtered_records = []
             self.refresh_table()
             self.status_var.set("Все записи удалены")
 
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка удаления всех записей: {str(e)}")
 
+    def delete_by_condition(self):
+        """Удаление записей по условию прямо в файле (файл читается построчно, без загрузки)"""
+        if not self.filename:
+            messagebox.showwarning("Предупреждение", "Сначала выберите файл")
+            return
+
+        if self.records.modified or (self.journal is not None and self.journal.running):
+            messagebox.showwarning("Предупреждение", "Сначала сохраните изменения загруженных данных")
+            return
+
+        dialog = tk.Toplevel(self.window)
+        dialog.title("Удаление по условию")
+        dialog.geometry("480x150")
+        dialog.resizable(False, False)
+        dialog.transient(self.window)
+        dialog.grab_set()
+
+        main_frame = ttk.Frame(dialog, padding="10")
+        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        ttk.Label(main_frame, text="Удалить записи, у которых:").grid(row=0, column=0, columnspan=3, sticky=tk.W)
+
+        field_var = tk.StringVar(value="release_date")
+        ttk.Combobox(main_frame, textvariable=field_var, values=self.headers, width=15,
+                     state="readonly").grid(row=1, column=0, pady=10)
+
+        operator_var = tk.StringVar(value="<")
+        ttk.Combobox(main_frame, textvariable=operator_var, values=list(OPERATORS), width=10,
+                     state="readonly").grid(row=1, column=1, padx=10, pady=10)
+
+        value_entry = ttk.Entry(main_frame, width=20)
+        value_entry.grid(row=1, column=2, pady=10)
+        value_entry.focus()
+
+        def start():
+            value = value_entry.get().strip()
+            if not value:
+                messagebox.showwarning("Предупреждение", "Введите значение для условия", parent=dialog)
+                return
+
+            operation = BulkDelete(self.filename, [(field_var.get(), operator_var.get(), value)])
+            dialog.destroy()
+
+            # Сначала подсчитываем подходящие записи, удаление - только после подтверждения
+            BackgroundTask(
+                self.window,
+                "Подсчет записей",
+                operation.preview,
+                lambda result: self.confirm_delete_by_condition(operation, result),
+                on_error=lambda error: messagebox.showerror("Ошибка", f"Ошибка чтения файла: {str(error)}"),
+                on_cancel=lambda: self.status_var.set("Подсчет записей отменен")
+            ).start()
+
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=2, column=0, columnspan=3)
+        ttk.Button(button_frame, text="Удалить", command=start).grid(row=0, column=0, padx=(0, 10))
+        ttk.Button(button_frame, text="Отмена", command=dialog.destroy).grid(row=0, column=1)
+
+    def confirm_delete_by_condition(self, operation, result):
+        """Подтверждение удаления записей по условию после подсчета"""
+        matched, total = result
+        if not matched:
+            messagebox.showinfo("Удаление по условию", "Нет записей, подходящих под условие")
+            return
+
+        if not messagebox.askyesno("Подтверждение",
+                                   f"Удалить {matched} из {total} записей?\n\n" +
+                                   "Это действие необратимо!"):
+            return
+
+        BackgroundTask(
+            self.window,
+            "Удаление записей",
+            operation.run,
+            self.on_delete_by_condition_done,
+            on_error=lambda error: messagebox.showerror("Ошибка", f"Ошибка удаления записей: {str(error)}"),
+            on_cancel=lambda: self.status_var.set("Удаление записей отменено, файл не изменен")
+        ).start()
+
+    def on_delete_by_condition_done(self, result):
+        """Завершение удаления записей по условию"""
+        deleted, remaining = result
+        self.datasets.invalidate(self.filename)
+        self.status_var.set(f"Удалено {deleted} записей. Осталось {remaining} записей")
+
+        # Загруженные данные устарели - загружаем файл заново
+        if self.journal is not None:
+            self.load_data()
+
     def save_data(self):
         """Сохранение данных в файл"""
         if not self.filename:
             messagebox.showwarning("Предупреждение", "Файл не выбран")
             return
 
-        try:
-            with open(self.filename, 'w', encoding='utf-8', newline='') as file:
-                writer = csv.DictWriter(file, fieldnames=self.headers)
-                writer.writeheader()
-                writer.writerows(self.records)
+        if self.journal is None:
+            messagebox.showwarning("Предупреждение", "Сначала загрузите данные")
+            return
+
+        if self.journal.running:
+            messagebox.showwarning("Предупреждение", "Файл уже записывается, дождитесь завершения")
+            return
 
-            messagebox.showinfo("Успех", "Изменения успешно сохранены")
-            self.status_var.set("Данные сохранены в файл")
+        try:
+            # Контрольная точка: таблица записывается в фоне, журнал изменений очищается
+            self.journal.checkpoint(
+                self.window,
+                self.datasets,
+                self.records.headers,
+                self.on_data_saved,
+                on_error=lambda error: messagebox.showerror("Ошибка", f"Ошибка сохранения файла: {str(error)}"),
+                on_cancel=lambda: self.status_var.set("Сохранение отменено")
+            )
 
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка сохранения файла: {str(e)}")
 
+    def compact_file(self):
+        """Фоновое сжатие файла: запись файла без удаленных строк"""
+        self.status_var.set("Сжатие файла...")
+        try:
+            self.journal.checkpoint(
+                self.window,
+                self.datasets,
+                self.records.headers,
+                lambda count: self.status_var.set(f"Файл сжат: записано {count} записей"),
+                on_error=lambda error: messagebox.showerror("Ошибка", f"Ошибка сжатия файла: {str(error)}"),
+                on_cancel=lambda: self.status_var.set("Сжатие файла отменено")
+            )
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка сжатия файла: {str(e)}")
+
+    def on_data_saved(self, count):
+        """Завершение сохранения"""
+        messagebox.showinfo("Успех", "Изменения успешно сохранены")
+        self.status_var.set("Данные сохранены в файл")
+
 
 if __name__ == "__main__":
     # Тестирование модуля
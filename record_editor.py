@@ -4,18 +4,29 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import csv
 import os
 
+from background_task import BackgroundTask
+from bulk_ops import OPERATORS, BulkUpdate, run_in_process
+from dataset_cache import DatasetCache, file_fingerprint
+from edit_journal import EditJournal
+from id_index import IdIndex
+from row_patcher import patch_row
+from virtual_table import VirtualTable
+
 
 class RecordEditor:
     """Класс для корректировки записей в файле"""
 
-    def __init__(self, parent):
+    def __init__(self, parent, datasets=None):
         self.parent = parent
+        # Общий кэш загруженных наборов данных
+        self.datasets = datasets if datasets is not None else DatasetCache()
         self.window = None
         self.filename = ""
         self.records = []
+        # Журнал изменений загруженного файла
+        self.journal = None
         self.headers = ["browser_id", "browser_name", "developer", "release_date", "latest_version", "engine"]
 
     def show(self):
@@ -60,9 +71,11 @@ class RecordEditor:
         ttk.Button(control_frame, text="Загрузить данные", command=self.load_data).grid(row=0, column=0, padx=(0, 10))
         ttk.Button(control_frame, text="Редактировать запись", command=self.edit_record).grid(row=0, column=1,
                                                                                               padx=(0, 10))
-        ttk.Button(control_frame, text="Сохранить изменения", command=self.save_data).grid(row=0, column=2,
+        ttk.Button(control_frame, text="Массовое изменение", command=self.bulk_update).grid(row=0, column=2,
+                                                                                            padx=(0, 10))
+        ttk.Button(control_frame, text="Сохранить изменения", command=self.save_data).grid(row=0, column=3,
                                                                                            padx=(0, 10))
-        ttk.Button(control_frame, text="Обновить таблицу", command=self.refresh_table).grid(row=0, column=3)
+        ttk.Button(control_frame, text="Обновить таблицу", command=self.refresh_table).grid(row=0, column=4)
 
         # Таблица для отображения записей
         table_frame = ttk.LabelFrame(main_frame, text="Записи браузеров", padding="5")
@@ -70,8 +83,8 @@ class RecordEditor:
         table_frame.columnconfigure(0, weight=1)
         table_frame.rowconfigure(0, weight=1)
 
-        # Создание Treeview
-        self.tree = ttk.Treeview(table_frame, columns=self.headers, show='headings', height=15)
+        # Создание виртуальной таблицы (элементы только для видимых строк)
+        self.tree = VirtualTable(table_frame, columns=self.headers, height=15)
 
         # Настройка заголовков
         column_widths = [80, 150, 150, 100, 120, 120]
@@ -79,15 +92,8 @@ class RecordEditor:
             self.tree.heading(header, text=header.replace('_', ' ').title())
             self.tree.column(header, width=column_widths[i], minwidth=50)
 
-        # Scrollbars
-        v_scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        h_scrollbar = ttk.Scrollbar(table_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
-        self.tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
-
-        # Размещение таблицы и scrollbars
+        # Размещение таблицы
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
 
         # Статусная строка
         self.status_var = tk.StringVar()
@@ -113,28 +119,43 @@ class RecordEditor:
             return
 
         try:
-            self.records = []
-            with open(self.filename, 'r', encoding='utf-8', newline='') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    self.records.append(row)
+            self.datasets.load(self.window, self.filename, self.on_data_loaded, on_error=self.on_load_error,
+                               on_cancel=lambda: self.status_var.set("Загрузка отменена"))
+        except Exception as e:
+            self.on_load_error(e)
 
-            self.refresh_table()
-            self.status_var.set(f"Загружено {len(self.records)} записей")
+    def on_data_loaded(self, table):
+        """Обработка загруженных данных"""
+        self.records = table
 
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка загрузки файла: {str(e)}")
+        # Изменения сразу записываются в журнал, поэтому они не теряются при сбое до сохранения
+        self.journal = EditJournal.for_table(self.records, self.filename)
+        self.recover_journal()
+        IdIndex.for_table(self.records).refresh()
+
+        self.refresh_table()
+        self.status_var.set(f"Загружено {len(self.records)} записей")
+
+    def recover_journal(self):
+        """Предложение применить изменения, оставшиеся в журнале с прошлой работы с файлом"""
+        entries = self.journal.pending()
+        if not entries:
+            return
+
+        if messagebox.askyesno("Журнал изменений",
+                               f"Найдены несохраненные изменения файла: {len(entries)}\n\n"
+                               "Применить их к загруженным данным?"):
+            self.journal.replay(entries)
+        else:
+            self.journal.discard()
+
+    def on_load_error(self, error):
+        """Обработка ошибки загрузки"""
+        messagebox.showerror("Ошибка", f"Ошибка загрузки файла: {str(error)}")
 
     def refresh_table(self):
         """Обновление таблицы"""
-        # Очистка таблицы
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # Заполнение таблицы
-        for i, record in enumerate(self.records):
-            values = [record.get(header, "") for header in self.headers]
-            self.tree.insert("", tk.END, iid=i, values=values)
+        self.tree.set_rows(self.records, self.records.row_ids())
 
     def edit_record(self):
         """Редактирование выбранной записи"""
@@ -143,8 +164,7 @@ class RecordEditor:
             messagebox.showwarning("Предупреждение", "Выберите запись для редактирования")
             return
 
-        item_id = selection[0]
-        record_index = int(item_id)
+        record_index = selection[0]
         record = self.records[record_index]
 
         self.show_edit_dialog(record, record_index)
@@ -207,20 +227,23 @@ class RecordEditor:
 
                 # Проверка уникальности ID (если ID изменился)
                 if new_data['browser_id'] != record['browser_id']:
-                    for i, r in enumerate(self.records):
-                        if i != record_index and r['browser_id'] == new_data['browser_id']:
-                            messagebox.showerror("Ошибка", "Браузер с таким ID уже существует")
-                            return
+                    if IdIndex.for_table(self.records).find(new_data['browser_id'], exclude=record_index) is not None:
+                        messagebox.showerror("Ошибка", "Браузер с таким ID уже существует")
+                        return
 
                 # Сохранение изменений
-                self.records[record_index] = new_data
-                self.refresh_table()
+                self.records.update(record_index, new_data)
+                in_place = self.write_change(record_index, new_data)
+                self.tree.refresh()
 
                 # Выделение измененной записи
-                self.tree.selection_set(str(record_index))
-                self.tree.focus(str(record_index))
+                self.tree.selection_set(record_index)
+                self.tree.see(record_index)
 
-                self.status_var.set("Запись успешно изменена")
+                if in_place:
+                    self.status_var.set("Запись успешно изменена и записана в файл")
+                else:
+                    self.status_var.set("Запись успешно изменена (будет записана в файл при сохранении)")
                 dialog.destroy()
 
             except Exception as e:
@@ -232,6 +255,142 @@ class RecordEditor:
         # Фокус на первое поле
         entries[self.headers[0]].focus()
 
+    def bulk_update(self):
+        """Изменение полей всех записей, подходящих под условие, прямо в файле (файл читается построчно)"""
+        if not self.filename:
+            messagebox.showwarning("Предупреждение", "Сначала выберите файл")
+            return
+
+        if self.journal is not None and (self.records.modified or self.journal.running):
+            messagebox.showwarning("Предупреждение", "Сначала сохраните изменения загруженных данных")
+            return
+
+        dialog = tk.Toplevel(self.window)
+        dialog.title("Массовое изменение записей")
+        dialog.geometry("500x380")
+        dialog.resizable(False, False)
+        dialog.transient(self.window)
+        dialog.grab_set()
+
+        main_frame = ttk.Frame(dialog, padding="10")
+        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        # Условие отбора записей
+        ttk.Label(main_frame, text="Изменить записи, у которых:").grid(row=0, column=0, columnspan=3, sticky=tk.W)
+
+        field_var = tk.StringVar(value="developer")
+        ttk.Combobox(main_frame, textvariable=field_var, values=self.headers, width=15,
+                     state="readonly").grid(row=1, column=0, pady=10)
+
+        operator_var = tk.StringVar(value="=")
+        ttk.Combobox(main_frame, textvariable=operator_var, values=list(OPERATORS), width=10,
+                     state="readonly").grid(row=1, column=1, padx=10, pady=10)
+
+        value_entry = ttk.Entry(main_frame, width=20)
+        value_entry.grid(row=1, column=2, pady=10)
+        value_entry.focus()
+
+        # Новые значения полей (ID не меняется: одинаковые ID у многих записей недопустимы)
+        ttk.Label(main_frame, text="Новые значения (пустое поле - без изменений):").grid(row=2, column=0,
+                                                                                        columnspan=3, sticky=tk.W)
+        entries = {}
+        for i, header in enumerate(self.headers[1:]):
+            ttk.Label(main_frame, text=header.replace('_', ' ').title() + ":").grid(row=3 + i, column=0,
+                                                                                   sticky=tk.W, pady=3)
+            entry = ttk.Entry(main_frame, width=30)
+            entry.grid(row=3 + i, column=1, columnspan=2, sticky=(tk.W, tk.E), pady=3)
+            entries[header] = entry
+
+        process_var = tk.BooleanVar(value=True)
+        row = 3 + len(entries)
+        ttk.Checkbutton(main_frame, text="Выполнять в отдельном процессе",
+                        variable=process_var).grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=(10, 0))
+
+        def start():
+            value = value_entry.get().strip()
+            if not value:
+                messagebox.showwarning("Предупреждение", "Введите значение для условия", parent=dialog)
+                return
+
+            assignments = {header: entry.get().strip() for header, entry in entries.items() if entry.get().strip()}
+            if not assignments:
+                messagebox.showwarning("Предупреждение", "Введите хотя бы одно новое значение", parent=dialog)
+                return
+
+            operation = BulkUpdate(self.filename, [(field_var.get(), operator_var.get(), value)], assignments)
+            in_process = process_var.get()
+            dialog.destroy()
+
+            # Сначала подсчитываем подходящие записи, изменение - только после подтверждения
+            BackgroundTask(
+                self.window,
+                "Подсчет записей",
+                self.bulk_work(operation, 'preview', in_process),
+                lambda result: self.confirm_bulk_update(operation, result, in_process),
+                on_error=lambda error: messagebox.showerror("Ошибка", f"Ошибка чтения файла: {str(error)}"),
+                on_cancel=lambda: self.status_var.set("Подсчет записей отменен")
+            ).start()
+
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=row + 1, column=0, columnspan=3, pady=(10, 0))
+        ttk.Button(button_frame, text="Изменить", command=start).grid(row=0, column=0, padx=(0, 10))
+        ttk.Button(button_frame, text="Отмена", command=dialog.destroy).grid(row=0, column=1)
+
+    def bulk_work(self, operation, method, in_process):
+        """Функция фоновой задачи для метода массовой операции (в рабочем потоке или в отдельном процессе)"""
+        if in_process:
+            return lambda task: run_in_process(operation, method, task)
+        return getattr(operation, method)
+
+    def confirm_bulk_update(self, operation, result, in_process):
+        """Подтверждение массового изменения после подсчета записей"""
+        matched, total = result
+        if not matched:
+            messagebox.showinfo("Массовое изменение", "Нет записей, подходящих под условие")
+            return
+
+        if not messagebox.askyesno("Подтверждение", f"Изменить {matched} из {total} записей?"):
+            return
+
+        BackgroundTask(
+            self.window,
+            "Изменение записей",
+            self.bulk_work(operation, 'run', in_process),
+            self.on_bulk_update_done,
+            on_error=lambda error: messagebox.showerror("Ошибка", f"Ошибка изменения записей: {str(error)}"),
+            on_cancel=lambda: self.status_var.set("Изменение записей отменено, файл не изменен")
+        ).start()
+
+    def on_bulk_update_done(self, result):
+        """Завершение массового изменения"""
+        updated, total = result
+        self.datasets.invalidate(self.filename)
+        self.status_var.set(f"Изменено {updated} из {total} записей")
+
+        # Загруженные данные устарели - загружаем файл заново
+        if self.journal is not None:
+            self.load_data()
+
+    def write_change(self, row_id, values):
+        """Запись изменения строки: прямо в файл, если строка помещается на свое место, иначе в журнал"""
+        try:
+            fingerprint = file_fingerprint(self.filename)
+            # Смещения строк действительны, только если файл не менялся с момента привязки журнала.
+            # Во время записи файла строка попадает только в журнал: старый файл будет заменен
+            if (not self.journal.running and list(fingerprint) == self.journal.fingerprint and
+                    patch_row(self.filename, self.records, row_id)):
+                fingerprint = file_fingerprint(self.filename)
+                self.journal.patched(row_id, fingerprint)
+                self.datasets.touch(self.filename, self.records, fingerprint)
+                self.records.modified = bool(self.journal.entries)
+                return True
+        except OSError:
+            pass
+
+        # Более длинные строки остаются в журнале до сохранения всего файла
+        self.journal.log_update(row_id, values)
+        return False
+
     def save_data(self):
         """Сохранение данных в файл"""
         if not self.filename:
@@ -242,18 +401,29 @@ class RecordEditor:
             messagebox.showwarning("Предупреждение", "Нет данных для сохранения")
             return
 
-        try:
-            with open(self.filename, 'w', encoding='utf-8', newline='') as file:
-                writer = csv.DictWriter(file, fieldnames=self.headers)
-                writer.writeheader()
-                writer.writerows(self.records)
+        if self.journal.running:
+            messagebox.showwarning("Предупреждение", "Файл уже записывается, дождитесь завершения")
+            return
 
-            messagebox.showinfo("Успех", "Данные успешно сохранены")
-            self.status_var.set("Данные сохранены в файл")
+        try:
+            # Контрольная точка: таблица записывается в фоне, журнал изменений очищается
+            self.journal.checkpoint(
+                self.window,
+                self.datasets,
+                self.records.headers,
+                self.on_data_saved,
+                on_error=lambda error: messagebox.showerror("Ошибка", f"Ошибка сохранения файла: {str(error)}"),
+                on_cancel=lambda: self.status_var.set("Сохранение отменено")
+            )
 
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка сохранения файла: {str(e)}")
 
+    def on_data_saved(self, count):
+        """Завершение сохранения"""
+        messagebox.showinfo("Успех", "Данные успешно сохранены")
+        self.status_var.set("Данные сохранены в файл")
+
 
 if __name__ == "__main__":
     # Тестирование модуля
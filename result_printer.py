@@ -4,19 +4,23 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import csv
 import os
 from datetime import datetime
 import subprocess
 import tempfile
 import platform
 
+from dataset_cache import DatasetCache
+from search_index import BitmapIndex, match_rows
+
 
 class ResultPrinter:
     """Класс для печати результатов анализа браузеров"""
 
-    def __init__(self, parent):
+    def __init__(self, parent, datasets=None):
         self.parent = parent
+        # Общий кэш загруженных наборов данных
+        self.datasets = datasets if datasets is not None else DatasetCache()
         self.window = None
         self.data = []
         self.filtered_data = []
@@ -148,18 +152,27 @@ class ResultPrinter:
             )
 
             if file_path:
-                self.data = []
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    reader = csv.DictReader(file)
-                    for row in reader:
-                        self.data.append(row)
-
-                self.update_filters()
-                self.status_var.set(f"Загружено {len(self.data)} записей")
-                messagebox.showinfo("Успех", f"Данные загружены успешно!\nЗаписей: {len(self.data)}")
+                self.datasets.load(self.window, file_path, self.on_data_loaded, on_error=self.on_load_error,
+                                   on_cancel=lambda: self.status_var.set("Загрузка отменена"))
 
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка загрузки данных: {str(e)}")
+            self.on_load_error(e)
+
+    def on_data_loaded(self, table):
+        """Обработка загруженных данных"""
+        self.data = table
+
+        # Битовые индексы для фильтров по разработчику и движку
+        for field in ('developer', 'engine'):
+            BitmapIndex.for_table(self.data, field).refresh()
+
+        self.update_filters()
+        self.status_var.set(f"Загружено {len(self.data)} записей")
+        messagebox.showinfo("Успех", f"Данные загружены успешно!\nЗаписей: {len(self.data)}")
+
+    def on_load_error(self, error):
+        """Обработка ошибки загрузки"""
+        messagebox.showerror("Ошибка", f"Ошибка загрузки данных: {str(error)}")
 
     def load_results(self):
         """Загрузка результатов расчетов"""
@@ -197,17 +210,21 @@ class ResultPrinter:
 
     def apply_filters(self):
         """Применение фильтров к данным"""
-        self.filtered_data = self.data.copy()
+        conditions = {}
 
         # Фильтр по разработчику
         if self.developer_filter.get() and self.developer_filter.get() != "Все":
-            self.filtered_data = [row for row in self.filtered_data
-                                  if row['developer'] == self.developer_filter.get()]
+            conditions['developer'] = self.developer_filter.get()
 
         # Фильтр по движку
         if self.engine_filter.get() and self.engine_filter.get() != "Все":
-            self.filtered_data = [row for row in self.filtered_data
-                                  if row['engine'] == self.engine_filter.get()]
+            conditions['engine'] = self.engine_filter.get()
+
+        if conditions:
+            # Пересечение битовых карт вместо просмотра всех записей
+            self.filtered_data = [self.data[row_id] for row_id in match_rows(self.data, conditions)]
+        else:
+            self.filtered_data = list(self.data)
 
     def preview_report(self):
         """Предварительный просмотр отчета"""
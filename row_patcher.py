@@ -0,0 +1,58 @@
+"""
+Модуль изменения строк CSV файла на месте (без перезаписи всего файла)
+"""
+
+import csv
+import io
+import os
+
+# Заполнение освободившегося места строки: лишние переводы строки читаются как пустые строки и пропускаются
+PADDING = b"\n"
+
+
+def encode_row(values, encoding='utf-8'):
+    """Строка CSV файла в байтах (с переводом строки)"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue().encode(encoding)
+
+
+def row_slot(filename, offsets, row_id):
+    """Место строки в файле: смещение начала и длина до начала следующей строки (байт)"""
+    start = offsets[row_id]
+    if row_id + 1 < len(offsets):
+        end = offsets[row_id + 1]
+    else:
+        end = os.path.getsize(filename)
+    return start, end - start
+
+
+def write_at(filename, offset, data):
+    """Запись байтов в файл по смещению со сбросом на диск"""
+    with open(filename, 'r+b') as file:
+        if hasattr(os, 'pwrite'):
+            os.pwrite(file.fileno(), data, offset)
+        else:
+            file.seek(offset)
+            file.write(data)
+            file.flush()
+        os.fsync(file.fileno())
+
+
+def patch_row(filename, table, row_id, encoding='utf-8'):
+    """Запись строки таблицы на ее место в файле
+
+    Смещения строк таблицы должны соответствовать текущему содержимому файла.
+    Возвращает False, если смещения неизвестны или новая строка длиннее старой
+    """
+    offsets = table.offsets
+    if offsets is None or len(offsets) != table.size:
+        return False
+
+    data = encode_row(table.row_values(row_id), encoding)
+    start, length = row_slot(filename, offsets, row_id)
+    if len(data) > length:
+        return False
+
+    write_at(filename, start, data + PADDING * (length - len(data)))
+    return True
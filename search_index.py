@@ -0,0 +1,207 @@
+"""
+Модуль индексов для быстрого поиска и фильтрации строк таблицы
+"""
+
+from array import array
+from collections import defaultdict
+from itertools import compress
+
+# Таблицы перевода между флагами строк (байты 0/1) и двоичной записью битовой карты
+FLAGS_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+DIGITS_TO_FLAGS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def flags_to_bitmap(flags):
+    """Битовая карта (целое число) из флагов строк: бит i установлен, если flags[i] == 1"""
+    return int(flags[::-1].translate(FLAGS_TO_DIGITS) or b'0', 2)
+
+
+def bitmap_to_rows(bitmap):
+    """Id строк, биты которых установлены в битовой карте (по возрастанию)"""
+    flags = format(bitmap, 'b').encode('ascii')[::-1].translate(DIGITS_TO_FLAGS)
+    return list(compress(range(len(flags)), flags))
+
+
+def trigrams(text):
+    """Множество триграмм строки"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class RowPostings:
+    """Списки id строк для каждого кода значения колонки"""
+
+    def __init__(self, table, field):
+        self.table = table
+        self.field = field
+        self.version = None
+        self.rows = {}
+
+    def refresh(self):
+        """Перестроение списков, если данные таблицы изменились"""
+        if self.version == self.table.version:
+            return
+
+        rows = defaultdict(lambda: array('I'))
+        for row_id, code in enumerate(self.table.columns[self.field].codes):
+            rows[code].append(row_id)
+        self.rows = dict(rows)
+        self.version = self.table.version
+
+    def get(self, code):
+        """Id строк с заданным кодом значения (включая удаленные строки)"""
+        self.refresh()
+        return self.rows.get(code, ())
+
+
+class TrigramIndex:
+    """Триграммный индекс для поиска подстроки (без учета регистра) в текстовой колонке"""
+
+    def __init__(self, table, field):
+        self.table = table
+        self.field = field
+        # Индекс строится по различным значениям колонки: словарь значений только пополняется,
+        # поэтому при изменениях таблицы достаточно доиндексировать новые значения
+        self.lowered = []
+        self.postings = defaultdict(set)
+        self.row_postings = RowPostings(table, field)
+
+    def update(self):
+        """Индексирование значений, добавленных в колонку после последнего обращения"""
+        values = self.table.columns[self.field].values
+        for code in range(len(self.lowered), len(values)):
+            text = values[code].lower()
+            self.lowered.append(text)
+            for trigram in trigrams(text):
+                self.postings[trigram].add(code)
+        self.row_postings.refresh()
+
+    def search_codes(self, text):
+        """Коды значений, содержащих подстроку"""
+        self.update()
+        text = text.lower()
+
+        if len(text) < 3:
+            # Для коротких запросов проверяем все различные значения
+            return [code for code, value in enumerate(self.lowered) if text in value]
+
+        # Кандидаты - пересечение списков по всем триграммам запроса, начиная с самого короткого
+        lists = sorted((self.postings.get(trigram, ()) for trigram in trigrams(text)), key=len)
+        candidates = set(lists[0])
+        for codes in lists[1:]:
+            candidates &= codes
+            if not candidates:
+                break
+
+        # Совпадение триграмм не гарантирует вхождение подстроки - проверяем кандидатов
+        return [code for code in candidates if text in self.lowered[code]]
+
+    def search(self, text):
+        """Id неудаленных строк, значение которых содержит подстроку (в порядке таблицы)"""
+        live = self.table.live
+        rows = []
+        for code in self.search_codes(text):
+            rows.extend(self.row_postings.get(code))
+        rows.sort()
+        return [row_id for row_id in rows if live[row_id]]
+
+    @classmethod
+    def for_table(cls, table, field):
+        """Общий для всех окон индекс колонки таблицы"""
+        return table.get_index(('trigram', field), lambda table: cls(table, field))
+
+
+class BitmapIndex:
+    """Битовые карты строк для значений колонки с небольшим числом различных значений
+
+    Карта значения строится при первом запросе одним проходом по кодам колонки, а затем
+    поддерживается построчно: добавленные строки дописываются при обращении, а измененные
+    строки таблица сообщает через on_update
+    """
+
+    def __init__(self, table, field):
+        self.table = table
+        self.field = field
+        # Битовые карты построенных значений по кодам и количество учтенных строк таблицы
+        self.bitmaps = {}
+        self.size = 0
+
+    def refresh(self):
+        """Учет строк, добавленных в таблицу после последнего обращения"""
+        size = self.table.size
+        if self.size == size:
+            return
+
+        codes = self.table.columns[self.field].codes
+        bitmaps = self.bitmaps
+        if not bitmaps:
+            # Карты еще не строились - новые строки войдут в них при построении
+            self.size = size
+            return
+        for row_id in range(self.size, size):
+            code = codes[row_id]
+            if code in bitmaps:
+                bitmaps[code] |= 1 << row_id
+        self.size = size
+
+    def on_update(self, row_id):
+        """Перенос измененной строки в карту ее нового значения (вызывается таблицей)"""
+        if row_id >= self.size:
+            return
+
+        code = self.table.columns[self.field].codes[row_id]
+        bit = 1 << row_id
+        for other, bitmap in self.bitmaps.items():
+            if other == code:
+                self.bitmaps[other] = bitmap | bit
+            elif bitmap & bit:
+                self.bitmaps[other] = bitmap ^ bit
+
+    def code_bitmap(self, code):
+        """Битовая карта строк с заданным кодом значения"""
+        bitmap = self.bitmaps.get(code)
+        if bitmap is None:
+            # Флаги строк вычисляются для одного кода за раз, без буфера на каждое значение
+            codes = self.table.columns[self.field].codes[:self.size]
+            bitmap = self.bitmaps[code] = flags_to_bitmap(bytes(map(code.__eq__, codes)))
+        return bitmap
+
+    def bitmap(self, value):
+        """Битовая карта строк с заданным значением (включая удаленные строки)"""
+        self.refresh()
+        bitmap = 0
+        for code in self.table.columns[self.field].codes_of(value):
+            bitmap |= self.code_bitmap(code)
+        return bitmap
+
+    @classmethod
+    def for_table(cls, table, field):
+        """Общий для всех окон индекс колонки таблицы"""
+        return table.get_index(('bitmap', field), lambda table: cls(table, field))
+
+
+class LiveBitmap:
+    """Битовая карта неудаленных строк таблицы"""
+
+    def __init__(self, table):
+        self.table = table
+        self.state = None
+        self.bitmap = 0
+
+    def get(self):
+        """Актуальная битовая карта"""
+        # Между изменениями версии строки только удаляются, поэтому пары (версия, число строк) достаточно
+        state = (self.table.version, self.table.live_count)
+        if state != self.state:
+            self.bitmap = flags_to_bitmap(self.table.live)
+            self.state = state
+        return self.bitmap
+
+
+def match_rows(table, conditions):
+    """Id неудаленных строк, у которых поля равны заданным значениям (пересечение битовых карт)"""
+    bitmap = table.get_index('live', LiveBitmap).get()
+    for field, value in conditions.items():
+        if not bitmap:
+            break
+        bitmap &= BitmapIndex.for_table(table, field).bitmap(value)
+    return bitmap_to_rows(bitmap)
@@ -0,0 +1,75 @@
+"""
+Модуль сохраненных индексов порядка сортировки (файлы-спутники рядом с CSV файлом)
+"""
+
+import json
+import os
+import sys
+from array import array
+
+from atomic_writer import atomic_open
+
+# Расширение файлов индекса порядка
+SORT_INDEX_SUFFIX = ".sortidx"
+
+
+def sort_index_path(filename, spec):
+    """Путь к файлу индекса для уровней сортировки (пар поле, по убыванию)"""
+    levels = '+'.join(f"{field}.{'desc' if reverse else 'asc'}" for field, reverse in spec)
+    return f"{filename}.{levels}{SORT_INDEX_SUFFIX}"
+
+
+def save_sort_index(filename, fingerprint, spec, offsets):
+    """Сохранение порядка строк (смещений строк в файле в порядке сортировки)"""
+    header = {
+        "spec": [[field, reverse] for field, reverse in spec],
+        "fingerprint": list(fingerprint),
+        "count": len(offsets),
+        "byteorder": sys.byteorder
+    }
+
+    path = sort_index_path(filename, spec)
+    with atomic_open(path, 'wb') as file:
+        file.write(json.dumps(header).encode('utf-8') + b"\n")
+        array('Q', offsets).tofile(file)
+    return path
+
+
+def load_sort_index(filename, fingerprint, spec):
+    """Загрузка порядка строк, если индекс существует и построен для текущего содержимого файла"""
+    path = sort_index_path(filename, spec)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as file:
+        try:
+            header = json.loads(file.readline().decode('utf-8'))
+        except ValueError:
+            return None
+
+        if (header.get("fingerprint") != list(fingerprint) or
+                header.get("spec") != [[field, reverse] for field, reverse in spec]):
+            # Файл изменился после сохранения индекса
+            return None
+
+        offsets = array('Q')
+        try:
+            offsets.fromfile(file, header["count"])
+        except EOFError:
+            return None
+
+    if header.get("byteorder") != sys.byteorder:
+        offsets.byteswap()
+    return offsets
+
+
+def offsets_to_rows(table, offsets):
+    """Id строк таблицы в порядке индекса (None, если индекс не соответствует таблице)"""
+    if table.offsets is None or len(offsets) != len(table):
+        return None
+
+    positions = dict(zip(table.offsets, range(len(table.offsets))))
+    rows = [positions.get(offset) for offset in offsets]
+    if None in rows:
+        return None
+    return rows
@@ -0,0 +1,136 @@
+"""
+Модуль типизированных ключей сортировки для колонок таблицы
+"""
+
+from datetime import datetime
+
+from version_parser import parse_version
+
+
+def sort_key(field, value):
+    """Ключ сортировки значения поля"""
+    # Специальная обработка для даты
+    if field == "release_date":
+        try:
+            # Попытка преобразовать в дату
+            return datetime.strptime(value, "%Y")
+        except ValueError:
+            try:
+                return datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                return datetime.min
+
+    # Специальная обработка для версий
+    elif field == "latest_version":
+        return parse_version(value)
+
+    # Специальная обработка для ID
+    elif field == "browser_id":
+        try:
+            return int(value)
+        except ValueError:
+            return 0
+
+    # Для остальных полей - строковая сортировка
+    return value.lower()
+
+
+class SortKeyIndex:
+    """Ключи сортировки колонки в виде рангов: ключ вычисляется один раз для каждого различного значения"""
+
+    def __init__(self, table, field):
+        self.table = table
+        self.field = field
+        # Ключи различных значений и ранг каждого значения (равные ключи - равные ранги)
+        self.value_keys = []
+        self.ranks = []
+        # Ранги строк таблицы и версия таблицы, для которой они построены
+        self.version = None
+        self.keys = []
+
+    def update_ranks(self):
+        """Вычисление ключей для новых значений колонки и пересчет рангов"""
+        values = self.table.columns[self.field].values
+        if len(values) == len(self.value_keys):
+            return
+
+        for value in values[len(self.value_keys):]:
+            self.value_keys.append(sort_key(self.field, value))
+
+        value_keys = self.value_keys
+        ranks = [0] * len(value_keys)
+        rank = -1
+        previous = None
+        for code in sorted(range(len(value_keys)), key=value_keys.__getitem__):
+            if rank < 0 or value_keys[code] != previous:
+                rank += 1
+                previous = value_keys[code]
+            ranks[code] = rank
+        self.ranks = ranks
+
+    def row_keys(self):
+        """Ранги всех строк таблицы (индекс - id строки)"""
+        if self.version != self.table.version:
+            self.update_ranks()
+            ranks = self.ranks
+            self.keys = [ranks[code] for code in self.table.columns[self.field].codes]
+            self.version = self.table.version
+        return self.keys
+
+    @classmethod
+    def for_table(cls, table, field):
+        """Общие для всех окон ключи колонки таблицы"""
+        return table.get_index(('sort', field), lambda table: cls(table, field))
+
+
+class DescendingKey:
+    """Обертка ключа с обратным порядком сравнения (для уровней сортировки по убыванию)"""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def composite_keys(key_columns, reverses=None):
+    """Единый целочисленный ключ строки для сортировки по нескольким колонкам рангов
+
+    Для уровней по убыванию ранги инвертируются, поэтому весь порядок получается одной сортировкой
+    по возрастанию
+    """
+    if reverses is None:
+        reverses = [False] * len(key_columns)
+
+    result = None
+    for keys, reverse in zip(key_columns, reverses):
+        top = max(keys, default=0)
+        if reverse:
+            keys = [top - rank for rank in keys]
+        if result is None:
+            result = list(keys)
+        else:
+            width = top + 1
+            result = [key * width + rank for key, rank in zip(result, keys)]
+    return result
+
+
+def reverse_sorted(order, keys):
+    """Обратный порядок для списка, устойчиво отсортированного по ключам (равные ключи сохраняют порядок)"""
+    result = order[::-1]
+    count = len(result)
+    start = 0
+    while start < count:
+        key = keys[result[start]]
+        end = start + 1
+        while end < count and keys[result[end]] == key:
+            end += 1
+        if end - start > 1:
+            result[start:end] = result[start:end][::-1]
+        start = end
+    return result
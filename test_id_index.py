@@ -0,0 +1,81 @@
+"""
+Тесты хэш-индекса идентификаторов записей
+"""
+
+from data_table import DataTable
+from id_index import EMPTY, IdIndex
+
+
+def make_table(ids):
+    """Таблица с заданными значениями ID"""
+    table = DataTable(["browser_id", "browser_name"])
+    table.extend([str(value), "browser"] for value in ids)
+    table.modified = False
+    return table
+
+
+def probe_lengths(index, table):
+    """Расстояния от начальной ячейки значения до ячейки его строки"""
+    lengths = []
+    for row_id in table.row_ids():
+        position = index.home(table.value(row_id, "browser_id"))
+        length = 0
+        while index.slots[position] != row_id:
+            assert index.slots[position] != EMPTY
+            position = (position + 1) & index.mask
+            length += 1
+        lengths.append(length)
+    return lengths
+
+
+def test_strided_ids_do_not_collide():
+    # ID с шагом, кратным степени двойки, не должны попадать в одни и те же ячейки
+    for stride in (1, 1024, 4096, 65536):
+        table = make_table(range(0, 100000 * stride, stride))
+        index = IdIndex.for_table(table)
+        index.refresh()
+
+        lengths = probe_lengths(index, table)
+        assert sum(lengths) / len(lengths) < 2
+        assert max(lengths) < 64
+
+
+def test_find_strided_ids():
+    stride = 4096
+    table = make_table(range(0, 50000 * stride, stride))
+    index = IdIndex.for_table(table)
+
+    assert index.find(str(1234 * stride)) == 1234
+    assert index.find(str(1234 * stride + 1)) is None
+    assert str(49999 * stride) in index
+
+    table.delete([1234])
+    assert index.find(str(1234 * stride)) is None
+
+    row_id = table.append({"browser_id": str(1234 * stride), "browser_name": "new"})
+    assert index.find(str(1234 * stride)) == row_id
+    assert index.next_id() == 49999 * stride + 1
+
+
+def test_text_ids():
+    table = make_table(["a1", "007", "b2"])
+    index = IdIndex.for_table(table)
+
+    assert index.find("007") == 1
+    assert index.find("7") is None
+    assert index.next_id() == 8
+
+
+def test_max_id_after_deleting_maximum():
+    table = make_table(range(1, 1001))
+    index = IdIndex.for_table(table)
+    assert index.next_id() == 1001
+
+    table.delete([999, 998])
+    assert index.max_id() == 998
+
+    table.update(997, {"browser_id": "5"})
+    assert index.max_id() == 997
+
+    table.append({"browser_id": "2000", "browser_name": "new"})
+    assert index.max_id() == 2000
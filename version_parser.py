@@ -0,0 +1,27 @@
+"""
+Модуль разбора строк версий браузеров
+"""
+
+import re
+from functools import lru_cache
+
+# Числовая часть версии: числа, разделенные точками (суффиксы вроде "b1" или "-beta" отбрасываются)
+VERSION_PATTERN = re.compile(r'\d+(?:\.\d+)*')
+
+
+@lru_cache(maxsize=65536)
+def parse_version(value):
+    """Версия в виде кортежа целых чисел: "11.0.110/134.0.3124.93" -> (11, 0, 110)
+
+    Для нескольких версий через "/" используется первая, строка без чисел дает пустой кортеж
+    """
+    match = VERSION_PATTERN.search(value.split('/', 1)[0])
+    if match is None:
+        return ()
+    return tuple(int(part) for part in match.group().split('.'))
+
+
+def major_version(value):
+    """Основная (первая) часть версии или None, если версия не содержит чисел"""
+    version = parse_version(value)
+    return version[0] if version else None
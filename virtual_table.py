@@ -0,0 +1,232 @@
+"""
+Модуль виртуальной таблицы: Treeview, в котором создаются элементы только для видимых строк
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualTable(ttk.Frame):
+    """Таблица на основе Treeview, отображающая только видимое окно строк набора данных"""
+
+    # Количество дополнительных элементов сверх видимой области
+    OVERSCAN = 2
+    # Высота строки и заголовка по умолчанию (до первой отрисовки)
+    DEFAULT_ROW_HEIGHT = 20
+    DEFAULT_HEADER_HEIGHT = 25
+    # Количество строк прокрутки колесом мыши
+    WHEEL_ROWS = 3
+
+    def __init__(self, parent, columns, height=15, selectmode='browse'):
+        super().__init__(parent)
+        self.columns = list(columns)
+
+        # Источник данных: таблица и id строк в порядке отображения
+        self.table = None
+        self.rows = []
+        self.top = 0
+        self.visible_count = height
+
+        # Элементы Treeview и id строк, которые они сейчас отображают
+        self.slots = []
+        self.slot_rows = []
+
+        # Выделенные строки (в том числе вне видимой области)
+        self.selected = set()
+
+        self.treeview = ttk.Treeview(self, columns=self.columns, show='headings',
+                                     height=height, selectmode=selectmode)
+
+        # Вертикальная прокрутка управляется таблицей, а не Treeview
+        self.v_scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        h_scrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.treeview.xview)
+        self.treeview.configure(xscrollcommand=h_scrollbar.set)
+
+        self.treeview.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        # Привязка событий
+        self.treeview.bind('<Configure>', self.on_resize)
+        self.treeview.bind('<<TreeviewSelect>>', self.on_select)
+        self.treeview.bind('<Button-1>', self.on_click)
+        self.treeview.bind('<Control-Button-1>', lambda event: None)
+        self.treeview.bind('<Shift-Button-1>', lambda event: None)
+        self.treeview.bind('<MouseWheel>', self.on_mousewheel)
+        self.treeview.bind('<Button-4>', lambda event: self.scroll_rows(-self.WHEEL_ROWS))
+        self.treeview.bind('<Button-5>', lambda event: self.scroll_rows(self.WHEEL_ROWS))
+        self.treeview.bind('<Up>', lambda event: self.move_focus(-1))
+        self.treeview.bind('<Down>', lambda event: self.move_focus(1))
+        self.treeview.bind('<Prior>', lambda event: self.move_focus(-self.visible_count))
+        self.treeview.bind('<Next>', lambda event: self.move_focus(self.visible_count))
+        self.treeview.bind('<Home>', lambda event: self.move_focus(-len(self.rows)))
+        self.treeview.bind('<End>', lambda event: self.move_focus(len(self.rows)))
+
+    # Настройка, совместимая с Treeview
+
+    def heading(self, column, **kwargs):
+        """Настройка заголовка столбца"""
+        return self.treeview.heading(column, **kwargs)
+
+    def column(self, column, **kwargs):
+        """Настройка столбца"""
+        return self.treeview.column(column, **kwargs)
+
+    def bind(self, sequence=None, func=None, add=None):
+        """Привязка обработчика события к Treeview"""
+        return self.treeview.bind(sequence, func, add)
+
+    # Работа с данными
+
+    def set_rows(self, table, rows):
+        """Установка источника данных: таблица и последовательность id строк для отображения"""
+        self.table = table
+        self.rows = rows
+        self.selected.clear()
+        self.render()
+
+    def clear(self):
+        """Очистка таблицы"""
+        self.set_rows(None, [])
+
+    def refresh(self):
+        """Перерисовка видимых строк (например, после изменения записей)"""
+        self.render()
+
+    def row_values(self, row_id):
+        """Значения строки для отображения"""
+        record = self.table[row_id]
+        return [record.get(column, "") for column in self.columns]
+
+    def render(self):
+        """Привязка элементов Treeview к строкам видимой области"""
+        count = len(self.rows)
+        self.top = max(0, min(self.top, count - self.visible_count))
+        needed = max(0, min(self.visible_count + self.OVERSCAN, count - self.top))
+
+        # Подгоняем количество элементов под размер видимой области
+        while len(self.slots) < needed:
+            self.slots.append(self.treeview.insert('', tk.END))
+        while len(self.slots) > needed:
+            self.treeview.delete(self.slots.pop())
+
+        self.slot_rows = list(self.rows[self.top:self.top + needed])
+        for iid, row_id in zip(self.slots, self.slot_rows):
+            self.treeview.item(iid, values=self.row_values(row_id))
+
+        # Восстанавливаем выделение видимых строк
+        self.treeview.selection_set([iid for iid, row_id in zip(self.slots, self.slot_rows)
+                                     if row_id in self.selected])
+        self.treeview.yview_moveto(0)
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        """Обновление положения полосы прокрутки"""
+        count = len(self.rows)
+        if count <= self.visible_count:
+            self.v_scrollbar.set(0.0, 1.0)
+        else:
+            self.v_scrollbar.set(self.top / count, min(1.0, (self.top + self.visible_count) / count))
+
+    # Прокрутка
+
+    def yview(self, *args):
+        """Обработка команд полосы прокрутки"""
+        count = len(self.rows)
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * count)
+        elif args[0] == 'scroll':
+            step = self.visible_count if args[2] == 'pages' else 1
+            self.top += int(args[1]) * step
+        self.render()
+
+    def scroll_rows(self, delta):
+        """Прокрутка на заданное количество строк"""
+        self.top += delta
+        self.render()
+        return "break"
+
+    def on_mousewheel(self, event):
+        """Прокрутка колесом мыши"""
+        if abs(event.delta) >= 120:
+            delta = -int(event.delta / 120) * self.WHEEL_ROWS
+        else:
+            delta = -event.delta
+        return self.scroll_rows(delta)
+
+    def on_resize(self, event):
+        """Пересчет количества видимых строк при изменении размера"""
+        row_height = self.DEFAULT_ROW_HEIGHT
+        header_height = self.DEFAULT_HEADER_HEIGHT
+        if self.slots:
+            bbox = self.treeview.bbox(self.slots[0])
+            if bbox:
+                header_height, row_height = bbox[1], bbox[3]
+
+        visible_count = max(1, (event.height - header_height) // max(1, row_height))
+        if visible_count != self.visible_count:
+            self.visible_count = visible_count
+            self.render()
+
+    # Выделение
+
+    def on_click(self, event):
+        """Обычный щелчок по строке сбрасывает выделение вне видимой области"""
+        if self.treeview.identify_region(event.x, event.y) == 'cell':
+            self.selected.clear()
+
+    def on_select(self, event):
+        """Синхронизация выделения видимых строк с общим набором выделенных строк"""
+        selected_slots = set(self.treeview.selection())
+        for iid, row_id in zip(self.slots, self.slot_rows):
+            if iid in selected_slots:
+                self.selected.add(row_id)
+            else:
+                self.selected.discard(row_id)
+
+    def move_focus(self, delta):
+        """Перемещение выделения клавишами с прокруткой"""
+        if not self.rows:
+            return "break"
+
+        focus = self.treeview.focus()
+        if focus in self.slots:
+            position = self.top + self.slots.index(focus)
+        else:
+            position = self.top
+
+        position = max(0, min(len(self.rows) - 1, position + delta))
+        self.selected = {self.rows[position]}
+        self.see_position(position)
+        self.treeview.focus(self.slots[position - self.top])
+        return "break"
+
+    def see_position(self, position):
+        """Прокрутка так, чтобы строка с заданной позицией была видна"""
+        if position < self.top:
+            self.top = position
+        elif position >= self.top + self.visible_count:
+            self.top = position - self.visible_count + 1
+        self.render()
+
+    def selection(self):
+        """Id выделенных строк"""
+        return list(self.selected)
+
+    def selection_set(self, row_ids):
+        """Выделение строк по их id"""
+        if isinstance(row_ids, int):
+            row_ids = [row_ids]
+        self.selected = set(row_ids)
+        self.render()
+
+    def see(self, row_id):
+        """Прокрутка к строке с заданным id"""
+        try:
+            position = self.rows.index(row_id)
+        except ValueError:
+            return
+        self.see_position(position)
+        self.treeview.focus(self.slots[position - self.top])